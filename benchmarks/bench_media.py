@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк водяного знаку та медіа-пайплайну.
+
+Генерує синтетичні фото (від VGA до 48MP, режими RGB/RGBA/P) і короткі відео локально,
+завантаження/відправка в Telegram замінені заглушками. Для кожного етапу показує
+пропускну здатність, p50/p95 затримки і піковий RSS.
+
+Кожен етап запускається в окремому процесі, щоб піковий RSS не змішувався між етапами.
+
+    python benchmarks/bench_media.py                    # прогін + порівняння з baseline
+    python benchmarks/bench_media.py --quick            # без 48MP і відео
+    python benchmarks/bench_media.py --save-baseline    # записати поточні результати як baseline
+    python benchmarks/bench_media.py --stage render_photo
+
+Якщо є baseline і p50 або піковий RSS гірші за нього більше ніж на --tolerance,
+скрипт завершується з кодом 1.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Конфіг вимагає змінні оточення — для бенчмарку вистачить заглушок.
+# Пул процесів вимикаємо, щоб обробка рахувалась у RSS вимірюваного процесу.
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+os.environ.setdefault("DATABASE_URL", "postgresql://bench@localhost/bench")
+os.environ.setdefault("ADMIN_IDS", "[1]")
+os.environ.setdefault("CHANNEL_ID", "-1")
+os.environ.setdefault("IMAGE_WORKERS", "0")
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+SIZES = {
+    "VGA": (640, 480),
+    "2MP": (1600, 1200),
+    "12MP": (4000, 3000),
+    "48MP": (8000, 6000),
+}
+MODES = ("RGB", "RGBA", "P")
+VIDEOS = {
+    "720p-5s": (1280, 720, 5),
+    "1080p-5s": (1920, 1080, 5),
+}
+ALBUM_SIZE = 10
+
+
+# --- СИНТЕТИЧНІ ДАНІ ---
+
+def make_image(size: tuple[int, int], mode: str):
+    """Гладке «фото» з шумом: кодується як справжні фото, а не як чистий шум"""
+    import numpy as np
+    from PIL import Image
+
+    w, h = size
+    rng = np.random.default_rng(w * h)
+    low = rng.integers(0, 256, (max(h // 16, 1), max(w // 16, 1), 3), dtype=np.uint8)
+    image = Image.fromarray(low).resize(size, Image.Resampling.BICUBIC)
+    if mode == "RGBA":
+        alpha = Image.linear_gradient("L").resize(size)
+        image.putalpha(alpha)
+    elif mode == "P":
+        image = image.quantize(colors=256)
+    return image
+
+
+def encode_image(image) -> bytes:
+    output = io.BytesIO()
+    if image.mode == "RGB":
+        image.save(output, format="JPEG", quality=92)
+    else:
+        image.save(output, format="PNG", compress_level=1)
+    return output.getvalue()
+
+
+def make_video(path: str, width: int, height: int, seconds: int) -> None:
+    from utils.watermark import get_ffmpeg_path
+
+    subprocess.run([
+        get_ffmpeg_path(), "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate=30",
+        "-f", "lavfi", "-i", "sine=frequency=440",
+        "-t", str(seconds), "-c:v", "libx264", "-preset", "ultrafast", "-g", "60",
+        "-c:a", "aac", "-shortest", path,
+    ], check=True)
+
+
+def photo_cases(quick: bool):
+    for size_name, size in SIZES.items():
+        if quick and size_name == "48MP":
+            continue
+        for mode in MODES:
+            yield f"{size_name}-{mode}", size, mode
+
+
+class StubBot:
+    """Bot із заглушками get_file/download_file: віддає локальні байти по file_id"""
+
+    def __init__(self, files: dict[str, bytes]):
+        self.files = files
+
+    async def get_file(self, file_id: str):
+        class File:
+            file_path = file_id
+            file_unique_id = None
+        return File()
+
+    async def download_file(self, file_path: str, destination=None, **kwargs):
+        data = self.files[file_path]
+        destination = destination if destination is not None else io.BytesIO()
+        for i in range(0, len(data), 65536):
+            destination.write(data[i:i + 65536])
+            destination.flush()
+        destination.seek(0)
+        return destination
+
+
+async def consume_upload(input_media) -> int:
+    """Заглушка відправки: читає InputFile так само, як це робить сесія aiogram"""
+    media = input_media.media
+    if isinstance(media, str):
+        return 0
+    total = 0
+    async for chunk in media.read(None):
+        total += len(chunk)
+    return total
+
+
+# --- ЕТАПИ ---
+
+def _timed(func, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def stage_pattern_cold(quick, repeat):
+    from utils import watermark
+
+    def run(size):
+        watermark.clear_watermark_cache()
+        watermark.create_pattern_layer(*size)
+
+    for case, size, mode in photo_cases(quick):
+        if mode != "RGB":
+            continue
+        yield case, size[0] * size[1], _timed(lambda: run(size), repeat)
+
+
+def stage_pattern_warm(quick, repeat):
+    from utils import watermark
+
+    for case, size, mode in photo_cases(quick):
+        if mode != "RGB":
+            continue
+        watermark.create_pattern_layer(*size)
+        yield case, size[0] * size[1], _timed(lambda: watermark.create_pattern_layer(*size), repeat)
+
+
+def stage_overlay_legacy(quick, repeat):
+    from utils import watermark
+
+    for case, size, mode in photo_cases(quick):
+        image = make_image(size, mode)
+        watermark.get_pattern(*size)
+        yield case, size[0] * size[1], _timed(lambda: watermark.overlay_logo_on_image(image), repeat)
+
+
+def stage_composite_rgb(quick, repeat):
+    from utils import watermark
+
+    for case, size, mode in photo_cases(quick):
+        image = make_image(size, mode)
+        watermark.get_pattern(*size)
+        yield case, size[0] * size[1], _timed(lambda: watermark.watermark_image_rgb(image), repeat)
+
+
+def stage_render_photo(quick, repeat):
+    from utils import watermark
+
+    for case, size, mode in photo_cases(quick):
+        data = encode_image(make_image(size, mode))
+        watermark.render_watermarked_photo(data)
+        yield case, size[0] * size[1], _timed(lambda: watermark.render_watermarked_photo(data), repeat)
+
+
+def stage_album_publish(quick, repeat):
+    from unittest import mock
+    from utils import watermark
+
+    for size_name, size in SIZES.items():
+        if quick and size_name == "48MP":
+            continue
+        data = encode_image(make_image(size, "RGB"))
+        bot = StubBot({f"photo{i}": data for i in range(ALBUM_SIZE)})
+        records = [{"file_id": f"photo{i}", "file_type": "photo", "file_unique_id": None}
+                   for i in range(ALBUM_SIZE)]
+
+        async def publish():
+            media_group = await watermark.process_album(bot, [dict(r) for r in records])
+            for input_media in media_group:
+                await consume_upload(input_media)
+
+        with mock.patch.object(watermark.db, "get_processed_media", mock.AsyncMock(return_value=None)):
+            loop = asyncio.new_event_loop()
+            loop.run_until_complete(publish())
+            timings = _timed(lambda: loop.run_until_complete(publish()), repeat)
+            loop.close()
+        yield f"{size_name}-x{ALBUM_SIZE}", size[0] * size[1] * ALBUM_SIZE, timings
+
+
+def _video_stage(quick, repeat, process):
+    with tempfile.TemporaryDirectory() as tmp:
+        for case, (w, h, seconds) in VIDEOS.items():
+            if quick:
+                continue
+            input_path = os.path.join(tmp, f"{case}.mp4")
+            output_path = os.path.join(tmp, f"{case}_out.mp4")
+            make_video(input_path, w, h, seconds)
+            yield case, w * h * seconds * 30, _timed(lambda: process(input_path, output_path), repeat)
+
+
+def stage_video(quick, repeat):
+    from utils import watermark
+    yield from _video_stage(quick, repeat, watermark.process_video_sync)
+
+
+def stage_video_segmented(quick, repeat):
+    from config import settings
+    from utils import watermark
+
+    # Примусово ріжемо навіть короткі синтетичні ролики
+    settings.VIDEO_SEGMENT_MIN_DURATION = 0
+    if settings.VIDEO_SEGMENT_WORKERS < 2:
+        settings.VIDEO_SEGMENT_WORKERS = max(2, os.cpu_count() or 1)
+    yield from _video_stage(quick, repeat, watermark.process_video_segmented)
+
+
+STAGES = {
+    "pattern_cold": stage_pattern_cold,
+    "pattern_warm": stage_pattern_warm,
+    "overlay_legacy": stage_overlay_legacy,
+    "composite_rgb": stage_composite_rgb,
+    "render_photo": stage_render_photo,
+    "album_publish": stage_album_publish,
+    "video": stage_video,
+    "video_segmented": stage_video_segmented,
+}
+
+
+def run_stage_in_process(name: str, quick: bool, repeat: int) -> dict:
+    """Виконується в дочірньому процесі: JSON з результатами в stdout"""
+    import logging
+    logging.disable(logging.WARNING)
+
+    cases = {}
+    for case, pixels, timings in STAGES[name](quick, repeat):
+        p50 = statistics.median(timings)
+        p95 = sorted(timings)[max(0, int(round(0.95 * len(timings))) - 1)]
+        cases[case] = {
+            "p50_ms": round(p50 * 1000, 2),
+            "p95_ms": round(p95 * 1000, 2),
+            "throughput_per_s": round(1 / p50, 2) if p50 else None,
+            "mpix_per_s": round(pixels / 1e6 / p50, 2) if p50 else None,
+        }
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {"cases": cases, "peak_rss_mb": round(peak_rss_mb, 1)}
+
+
+# --- ЗВІТ І ПОРІВНЯННЯ ---
+
+def print_report(results: dict) -> None:
+    for stage, result in results.items():
+        print(f"\n▶ {stage}  (peak RSS: {result['peak_rss_mb']} MB)")
+        print(f"  {'case':<16}{'p50 ms':>10}{'p95 ms':>10}{'ops/s':>9}{'MP/s':>9}")
+        for case, r in result["cases"].items():
+            print(f"  {case:<16}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+                  f"{r['throughput_per_s'] or '-':>9}{r['mpix_per_s'] or '-':>9}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for stage, result in results.items():
+        base = baseline.get(stage)
+        if not base:
+            continue
+        limit = base["peak_rss_mb"] * (1 + tolerance)
+        if result["peak_rss_mb"] > limit:
+            regressions.append(f"{stage}: peak RSS {result['peak_rss_mb']} MB > {base['peak_rss_mb']} MB")
+        for case, r in result["cases"].items():
+            base_case = base["cases"].get(case)
+            if base_case and r["p50_ms"] > base_case["p50_ms"] * (1 + tolerance):
+                regressions.append(f"{stage}/{case}: p50 {r['p50_ms']} ms > {base_case['p50_ms']} ms")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stage", action="append", choices=list(STAGES), help="запустити лише ці етапи")
+    parser.add_argument("--quick", action="store_true", help="без 48MP і відео")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустиме погіршення (0.25 = 25%%)")
+    parser.add_argument("--json", help="зберегти результати в JSON")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_stage_in_process(args.child, args.quick, args.repeat)))
+        return 0
+
+    results = {}
+    for name in args.stage or STAGES:
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", name, "--repeat", str(args.repeat)]
+        if args.quick:
+            cmd.append("--quick")
+        print(f"⏱️  {name}...", flush=True)
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(proc.stderr)
+            return 1
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        if result["cases"]:
+            results[name] = result
+
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Baseline збережено: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("\nℹ️ Baseline ще немає — запустіть з --save-baseline")
+        return 0
+
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    if regressions:
+        print("\n❌ Регресії відносно baseline:")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print("\n✅ Регресій відносно baseline немає")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
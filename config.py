@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List, Tuple
 
 class Settings(BaseSettings):
     BOT_TOKEN: str
@@ -7,6 +7,107 @@ class Settings(BaseSettings):
     ADMIN_IDS: List[int]
     CHANNEL_ID: int  # Основний канал для публікацій
 
+    # Водяний знак: кеш готових логотипів (шт.) і шарів-патернів (МБ)
+    WATERMARK_LOGO_CACHE_SIZE: int = 16
+    WATERMARK_PATTERN_CACHE_MB: int = 256
+    # Скільки PNG-патернів для відео (по одному на роздільність) тримати в temp/
+    WATERMARK_PATTERN_PNG_FILES: int = 32
+    # Стеля пам'яті на одне фото у воркері; більші кадри обробляються смугами.
+    # Кадр, що не влазить навіть так, декодується зменшеним (JPEG, нестиснені TIFF/BMP/PPM);
+    # PNG і стиснений TIFF понад ліміт публікуються без водяного знаку
+    WATERMARK_MEMORY_LIMIT_MB: int = 512
+
+    # Обробка фото в окремих процесах: скільки одночасно (0 — рахувати в потоці)
+    IMAGE_WORKERS: int = 2
+    IMAGE_QUEUE_SIZE: int = 8
+    IMAGE_JOB_TIMEOUT: float = 60.0
+
+    # Профіль вихідних фото: channel (до 2560px), original (повний розмір), compact
+    PHOTO_PROFILE: str = "channel"
+
+    # Завантажені фото до цього розміру тримаються в пам'яті, більші — на диску
+    MEDIA_SPOOL_MAX_MB: int = 4
+
+    # Скільки файлів альбому обробляти одночасно при публікації
+    ALBUM_PHOTO_CONCURRENCY: int = 4
+    ALBUM_VIDEO_CONCURRENCY: int = 2
+
+    # Кодування відео з водяним знаком (ffmpeg)
+    FFMPEG_PATH: str = ""  # порожньо — шукати в PATH або в imageio-ffmpeg
+    VIDEO_CODEC: str = "libx264"
+    VIDEO_PRESET: str = "veryfast"
+    VIDEO_CRF: int = 23
+    VIDEO_THREADS: int = 0  # 0 — ffmpeg сам вибирає
+    VIDEO_TIMEOUT: float = 600.0
+    # Довгі відео ріжуться на сегменти і обробляються паралельно
+    VIDEO_SEGMENT_WORKERS: int = 0  # 0 — за кількістю ядер, 1 — вимкнено
+    VIDEO_SEGMENT_MIN_DURATION: float = 60.0  # секунд
+
+    # Пул з'єднань з БД (psycopg_pool)
+    DB_POOL_MIN_SIZE: int = 2  # відкриваються ще до старту бота
+    DB_POOL_MAX_SIZE: int = 10
+    DB_POOL_MAX_WAITING: int = 0  # черга клієнтів на з'єднання, 0 — без обмеження
+    DB_POOL_TIMEOUT: float = 30.0  # скільки клієнт чекає на з'єднання, секунд
+    DB_POOL_MAX_LIFETIME: float = 3600.0  # з'єднання старше за це перевідкривається
+    DB_POOL_MAX_IDLE: float = 600.0  # зайві простоюючі з'єднання закриваються
+    DB_PREPARE_THRESHOLD: int = 5  # після скількох викликів запит стає prepared, -1 — ніколи
+    DB_STATEMENT_TIMEOUT_MS: int = 30000  # 0 — без обмеження
+    DB_POOL_STATS_INTERVAL: float = 300.0  # як часто писати стан пулу в лог, 0 — не писати
+
+    # Антиспам: для кожної дії (місткість бакета, секунд на відновлення однієї спроби)
+    RATE_LIMITS: Dict[str, Tuple[int, float]] = {
+        "news": (3, 60.0),
+        "ad": (2, 300.0),
+        "other": (3, 60.0),
+        "direct": (5, 30.0),
+    }
+    RATE_LIMIT_MAX_BUCKETS: int = 50000  # найдавніше використані бакети витісняються
+    RATE_LIMIT_CHECKPOINT_INTERVAL: float = 30.0  # як часто зберігати стан у БД, секунд
+    RATE_LIMIT_RETENTION: float = 86400.0  # старші записи в БД видаляються
+
+    # Кеш заявок і їх медіа для адмінських кнопок (записів на кожен вид, секунд)
+    FEEDBACK_CACHE_SIZE: int = 1000
+    FEEDBACK_CACHE_TTL: float = 3600.0
+
+    # Помісячні партиції feedbacks/media/replies
+    PARTITION_MONTHS_AHEAD: int = 3  # скільки місяців уперед створювати заздалегідь
+    PARTITION_RETENTION_MONTHS: int = 0  # старші місяці архівуються і від'єднуються, 0 — зберігати все
+    PARTITION_ARCHIVE_DIR: str = "archive"
+    PARTITION_MAINTENANCE_INTERVAL: float = 21600.0  # секунд
+
+    # Розсилка адмінам: ліміти Telegram (повідомлень за секунду) і повтори після 429
+    FANOUT_GLOBAL_RATE: float = 25.0
+    FANOUT_CHAT_RATE: float = 1.0
+    FANOUT_CHAT_BURST: int = 3
+    FANOUT_MAX_RETRIES: int = 5
+
+    # Центральна черга відправок (utils/outbound.py)
+    OUTBOUND_SLOTS: int = 8  # одночасних запитів до Bot API
+    OUTBOUND_BACKGROUND_SLOTS: int = 4  # з них максимум під канал і bulk
+    OUTBOUND_GROUP_RATE: float = 0.33  # повідомлень/с у групу чи канал (~20 за хвилину)
+
+    # Отримання оновлень: "polling" або "webhook"
+    BOT_MODE: str = "polling"
+    WEBHOOK_URL: str = ""  # публічна адреса, напр. https://bot.example.com; порожньо — не реєструвати
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_SECRET: str = ""  # обов'язковий у режимі webhook, символи A-Z a-z 0-9 _ -
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    WEBHOOK_WORKERS: int = 8
+    WEBHOOK_QUEUE_SIZE: int = 1000  # всього на всі черги воркерів
+    WEBHOOK_PUT_TIMEOUT: float = 5.0  # скільки чекати місця в черзі, потім 503
+    WEBHOOK_RECORD_PATH: str = ""  # дописувати сирі оновлення в JSONL (для replay)
+
+    # Стан FSM (чернетки заявок) у БД: покинуті розмови видаляються через FSM_STATE_TTL секунд,
+    # локальний кеш — FSM_CACHE_SIZE ключів на FSM_CACHE_TTL секунд
+    FSM_STATE_TTL: float = 172800.0
+    FSM_CACHE_SIZE: int = 10000
+    FSM_CACHE_TTL: float = 600.0
+    FSM_SWEEP_INTERVAL: float = 3600.0
+
+    # Скільки секунд /stats віддає закешовані цифри
+    STATS_CACHE_TTL: float = 30.0
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -1,9 +1,12 @@
 # database/db.py
+import asyncio
+import time
 import psycopg
 from psycopg_pool import AsyncConnectionPool
 from psycopg.rows import dict_row
-from datetime import datetime, timezone
 from config import settings
+from database.migrations import run_migrations, STATS_BACKFILL
+from database.cache import TTLCache
 import logging
 
 # Налаштування логування для БД
@@ -13,72 +16,94 @@ class DB:
     def __init__(self):
         self.dsn = settings.DATABASE_URL
         self.pool = None
+        self._stats_task: asyncio.Task | None = None
+        # Кеш /stats: (час завантаження, {period: [(category, count)]})
+        self._feedback_stats: tuple[float, dict] | None = None
+        # Заявку читають адмінські кнопки через секунди після запису — тримаємо її під рукою
+        self._feedback_cache = TTLCache(settings.FEEDBACK_CACHE_SIZE, settings.FEEDBACK_CACHE_TTL)
+        self._media_cache = TTLCache(settings.FEEDBACK_CACHE_SIZE, settings.FEEDBACK_CACHE_TTL)
 
     async def connect(self):
         """Створює пул з'єднань з базою даних"""
         try:
+            prepare_threshold = settings.DB_PREPARE_THRESHOLD
             self.pool = AsyncConnectionPool(
                 conninfo=self.dsn,
                 open=False,
-                kwargs={"row_factory": dict_row} # Для psycopg 3.x
+                min_size=settings.DB_POOL_MIN_SIZE,
+                max_size=max(settings.DB_POOL_MAX_SIZE, settings.DB_POOL_MIN_SIZE),
+                max_waiting=settings.DB_POOL_MAX_WAITING,
+                timeout=settings.DB_POOL_TIMEOUT,
+                max_lifetime=settings.DB_POOL_MAX_LIFETIME,
+                max_idle=settings.DB_POOL_MAX_IDLE,
+                # Перевірка з'єднання перед видачею: мертве після рестарту БД не дістанеться хендлеру
+                check=AsyncConnectionPool.check_connection,
+                configure=self._configure_connection,
+                kwargs={
+                    "row_factory": dict_row,  # Для psycopg 3.x
+                    "prepare_threshold": prepare_threshold if prepare_threshold >= 0 else None,
+                },
+            )
+            # Чекаємо, поки відкриються всі min_size з'єднань — перші запити не платять за підключення
+            await self.pool.open(wait=True, timeout=settings.DB_POOL_TIMEOUT)
+            logger.info(
+                f"✅ Підключення до БД успішне (Connection Pool, "
+                f"{settings.DB_POOL_MIN_SIZE}-{self.pool.max_size} з'єднань)"
             )
-            await self.pool.open()
-            logger.info("✅ Підключення до БД успішне (Connection Pool)")
             await self.create_tables()
+            if settings.DB_POOL_STATS_INTERVAL > 0:
+                self._stats_task = asyncio.create_task(self._log_pool_stats())
         except Exception as e:
             logger.error(f"❌ Критична помилка підключення до БД: {e}")
             raise e
 
+    @staticmethod
+    async def _configure_connection(conn: psycopg.AsyncConnection) -> None:
+        """Виконується для кожного нового з'єднання пулу"""
+        await conn.execute(
+            "SELECT set_config('statement_timeout', %s, false)",
+            (str(settings.DB_STATEMENT_TIMEOUT_MS),)
+        )
+        # Пул приймає тільки з'єднання без відкритої транзакції
+        await conn.commit()
+
+    def pool_stats(self) -> dict:
+        """Лічильники пулу (psycopg_pool get_stats): розмір, черга, час очікування, помилки"""
+        if self.pool is None:
+            return {}
+        return self.pool.get_stats()
+
+    async def _log_pool_stats(self) -> None:
+        """Періодично пише стан пулу в лог; якщо клієнти чекали на з'єднання — попередження"""
+        last_queued = last_errors = 0
+        while True:
+            await asyncio.sleep(settings.DB_POOL_STATS_INTERVAL)
+            stats = self.pool_stats()
+            queued = stats.get("requests_queued", 0)
+            errors = stats.get("requests_errors", 0)
+            message = (
+                f"🗄️ Пул БД: {stats.get('pool_size', 0)}/{stats.get('pool_max', 0)} з'єднань, "
+                f"вільних {stats.get('pool_available', 0)}, чекають {stats.get('requests_waiting', 0)}, "
+                f"запитів {stats.get('requests_num', 0)}, у черзі було {queued}, "
+                f"таймаутів/помилок {errors}"
+            )
+            if queued > last_queued or errors > last_errors:
+                logger.warning(message)
+            else:
+                logger.info(message)
+            last_queued, last_errors = queued, errors
+
+    async def close(self):
+        """Зупиняє моніторинг і закриває пул"""
+        if self._stats_task is not None:
+            self._stats_task.cancel()
+            self._stats_task = None
+        if self.pool is not None:
+            await self.pool.close()
+
     async def create_tables(self):
-        async with self.pool.connection() as conn:
-            async with conn.cursor() as cur:
-                await cur.execute('''
-                    CREATE TABLE IF NOT EXISTS feedbacks (
-                        id SERIAL PRIMARY KEY,
-                        user_id BIGINT,
-                        username TEXT,
-                        category TEXT,
-                        content TEXT,
-                        photo_file_id TEXT,
-                        video_file_id TEXT,
-                        document_file_id TEXT,
-                        group_message_id INT,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                await cur.execute('''
-                    CREATE TABLE IF NOT EXISTS rate_limits (
-                        user_id BIGINT PRIMARY KEY,
-                        last_feedback TIMESTAMP
-                    )
-                ''')
-                await cur.execute('''
-                    CREATE TABLE IF NOT EXISTS replies (
-                        id SERIAL PRIMARY KEY,
-                        feedback_id INT REFERENCES feedbacks(id) ON DELETE CASCADE,
-                        admin_id BIGINT,
-                        reply_text TEXT,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                await cur.execute('''
-                    CREATE TABLE IF NOT EXISTS media (
-                        id SERIAL PRIMARY KEY,
-                        feedback_id INT REFERENCES feedbacks(id) ON DELETE CASCADE,
-                        file_id TEXT NOT NULL,
-                        file_type TEXT NOT NULL,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                # Перевірка та додавання колонок, якщо їх немає (міграції на льоту)
-                for col in ['photo_file_id', 'video_file_id', 'document_file_id']:
-                    await cur.execute(f'''
-                        ALTER TABLE feedbacks ADD COLUMN IF NOT EXISTS {col} TEXT
-                    ''')
-                await cur.execute('''
-                    ALTER TABLE feedbacks ADD COLUMN IF NOT EXISTS group_message_id INT
-                ''')
-            # pool.connection() автоматично робить commit при виході з контексту, якщо не було помилок
+        """Застосовує нові міграції схеми (див. database/migrations.py)"""
+        await run_migrations(self.dsn)
 
     async def add_feedback(self, user_id: int, username: str, category: str, content: str,
                           photo_file_id: str | None = None, video_file_id: str | None = None,
@@ -88,58 +113,174 @@ class DB:
                 await cur.execute(
                     """INSERT INTO feedbacks 
                     (user_id, username, category, content, photo_file_id, video_file_id, document_file_id) 
-                    VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id""",
+                    VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING *""",
                     (user_id, username, category, content, photo_file_id, video_file_id, document_file_id)
                 )
-                feedback_id = (await cur.fetchone())["id"]
-                
+                row = await cur.fetchone()
+        feedback_id = row["id"]
+        self._feedback_cache.set(feedback_id, row)
+        self._media_cache.set(feedback_id, [])
+        return feedback_id
+
+    async def add_feedback_with_media(self, user_id: int, username: str, category: str, content: str,
+                                      media_files: list | None = None) -> int:
+        """
+        Записує feedback і всі його медіа однією командою
+        (CTE з INSERT ... RETURNING + unnest) — один запит до БД і одна транзакція.
+        media_files — список {'file_id', 'type', 'file_unique_id'} у порядку альбому.
+        """
+        media_files = media_files or []
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
                 await cur.execute(
-                    """INSERT INTO rate_limits (user_id, last_feedback) 
-                    VALUES (%s, CURRENT_TIMESTAMP) 
-                    ON CONFLICT (user_id) DO UPDATE SET last_feedback = CURRENT_TIMESTAMP""",
-                    (user_id,)
+                    """WITH fb AS (
+                        INSERT INTO feedbacks (user_id, username, category, content)
+                        VALUES (%(user_id)s, %(username)s, %(category)s, %(content)s)
+                        RETURNING *
+                    ), m AS (
+                        INSERT INTO media (feedback_id, file_id, file_type, file_unique_id)
+                        SELECT fb.id, x.file_id, x.file_type, x.file_unique_id
+                        FROM fb CROSS JOIN unnest(%(file_ids)s::text[], %(file_types)s::text[],
+                                                  %(file_unique_ids)s::text[])
+                            WITH ORDINALITY AS x(file_id, file_type, file_unique_id, n)
+                        ORDER BY x.n
+                    )
+                    SELECT * FROM fb""",
+                    {
+                        "user_id": user_id,
+                        "username": username,
+                        "category": category,
+                        "content": content,
+                        "file_ids": [m['file_id'] for m in media_files],
+                        "file_types": [m['type'] for m in media_files],
+                        "file_unique_ids": [m.get('file_unique_id') for m in media_files],
+                    }
                 )
+                row = await cur.fetchone()
+        feedback_id = row["id"]
+        self._feedback_cache.set(feedback_id, row)
+        self._media_cache.set(feedback_id, [
+            {'file_id': m['file_id'], 'file_type': m['type'], 'file_unique_id': m.get('file_unique_id')}
+            for m in media_files
+        ])
         return feedback_id
 
-    async def check_rate_limit(self, user_id: int) -> bool:
-        """Повертає True, якщо можна писати. False, якщо треба чекати."""
-        # АНТИСПАМ ВИМКНЕНО - завжди повертає True
-        return True
-
-        # async with self.pool.connection() as conn:
-        #     async with conn.cursor() as cur:
-        #         await cur.execute("SELECT last_feedback FROM rate_limits WHERE user_id = %s", (user_id,))
-        #         row = await cur.fetchone()
-        #         if row:
-        #             last_time = row["last_feedback"]
-        #             # Якщо база повертає naive datetime, вважаємо це UTC
-        #             if last_time.tzinfo is None:
-        #                 last_time = last_time.replace(tzinfo=timezone.utc)
-        #
-        #             diff = (datetime.now(timezone.utc) - last_time).total_seconds()
-        #             if diff < 60:
-        #                 return False
-        # return True
+    async def load_rate_buckets(self, max_age: float) -> list:
+        """Стан лімітів, змінений не раніше ніж max_age секунд тому (для відновлення після рестарту)"""
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    """SELECT user_id, action, tokens, updated_at FROM rate_limit_buckets
+                    WHERE updated_at >= now() - make_interval(secs => %s)""",
+                    (max_age,)
+                )
+                return await cur.fetchall()
+
+    async def save_rate_buckets(self, buckets: list[tuple]) -> None:
+        """Зберігає (user_id, action, tokens, updated_at) одним пакетом"""
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.executemany(
+                    """INSERT INTO rate_limit_buckets (user_id, action, tokens, updated_at)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (user_id, action) DO UPDATE
+                    SET tokens = EXCLUDED.tokens, updated_at = EXCLUDED.updated_at""",
+                    buckets
+                )
+                # Старі записи вже не обмежують нікого: бакет за цей час наповнився б повністю
+                await cur.execute(
+                    "DELETE FROM rate_limit_buckets WHERE updated_at < now() - make_interval(secs => %s)",
+                    (settings.RATE_LIMIT_RETENTION,)
+                )
 
     async def get_stats(self, period: str) -> list:
+        """
+        Кількість заявок за категоріями: 'day' — сьогодні, 'week' — останні 7 днів, інакше — за весь час.
+        Рахується з feedback_stats_daily (рядок на день і категорію), а не з feedbacks,
+        тому не залежить від обсягу історії. Результат кешується на STATS_CACHE_TTL секунд.
+        """
+        cached = self._feedback_stats
+        if cached is None or time.monotonic() - cached[0] > settings.STATS_CACHE_TTL:
+            cached = (time.monotonic(), await self._load_stats())
+            self._feedback_stats = cached
+        key = period if period in ('day', 'week') else 'all'
+        return cached[1][key]
+
+    async def _load_stats(self) -> dict:
+        """Всі три періоди одним запитом"""
         async with self.pool.connection() as conn:
             async with conn.cursor() as cur:
-                if period == 'day':
-                    query = "SELECT category, COUNT(*) as count FROM feedbacks WHERE timestamp >= CURRENT_TIMESTAMP - INTERVAL '1 day' GROUP BY category"
-                elif period == 'week':
-                    query = "SELECT category, COUNT(*) as count FROM feedbacks WHERE timestamp >= CURRENT_TIMESTAMP - INTERVAL '7 days' GROUP BY category"
-                else:
-                    query = "SELECT category, COUNT(*) as count FROM feedbacks GROUP BY category"
-
-                await cur.execute(query)
+                await cur.execute(
+                    """SELECT category,
+                        SUM(count) FILTER (WHERE day = CURRENT_DATE) AS day,
+                        SUM(count) FILTER (WHERE day > CURRENT_DATE - 7) AS week,
+                        SUM(count) AS all
+                    FROM feedback_stats_daily
+                    GROUP BY category
+                    ORDER BY category"""
+                )
                 rows = await cur.fetchall()
-                return [(row['category'], row['count']) for row in rows] if rows else []
+        return {
+            period: [(row['category'], int(row[period])) for row in rows if row[period]]
+            for period in ('day', 'week', 'all')
+        }
+
+    async def backfill_stats(self) -> int:
+        """Перераховує feedback_stats_daily з feedbacks. Повертає кількість рядків зведення."""
+        async with self.pool.connection() as conn:
+            async with conn.transaction():
+                for statement in STATS_BACKFILL:
+                    await conn.execute(statement)
+                cur = await conn.execute("SELECT COUNT(*) AS n FROM feedback_stats_daily")
+                rows = (await cur.fetchone())["n"]
+        self._feedback_stats = None
+        return rows
 
     async def get_feedback(self, feedback_id: int) -> dict | None:
+        row = self._feedback_cache.get(feedback_id)
+        if row is None:
+            async with self.pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute("SELECT * FROM feedbacks WHERE id = %s", (feedback_id,))
+                    row = await cur.fetchone()
+            if row is None:
+                return None
+            self._feedback_cache.set(feedback_id, row)
+        # Копія: зміни у хендлері не мають потрапити в кеш
+        return dict(row)
+
+    async def list_feedback(self, category: str | None = None, before_id: int | None = None,
+                            query: str | None = None, limit: int = 20) -> tuple[list, int | None]:
+        """
+        Сторінка заявок від новіших до старіших.
+        Пагінація по ключу (id < before_id), тому будь-яка сторінка коштує як перша.
+        query — пошук по тексту (синтаксис websearch: слова, "фраза", -виключити).
+        Повертає (рядки, before_id для наступної сторінки або None, якщо це остання).
+        """
+        conditions, params = [], []
+        if category:
+            conditions.append("category = %s")
+            params.append(category)
+        if before_id:
+            conditions.append("id < %s")
+            params.append(before_id)
+        if query:
+            conditions.append("content_tsv @@ websearch_to_tsquery('simple', %s)")
+            params.append(query)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
         async with self.pool.connection() as conn:
             async with conn.cursor() as cur:
-                await cur.execute("SELECT * FROM feedbacks WHERE id = %s", (feedback_id,))
-                return await cur.fetchone()
+                await cur.execute(
+                    f"""SELECT id, username, category, content, timestamp FROM feedbacks
+                    {where} ORDER BY id DESC LIMIT %s""",
+                    (*params, limit + 1)
+                )
+                rows = await cur.fetchall()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, rows[-1]["id"]
+        return rows, None
 
     async def add_reply(self, feedback_id: int, admin_id: int, reply_text: str) -> int:
         async with self.pool.connection() as conn:
@@ -158,6 +299,7 @@ class DB:
                     "UPDATE feedbacks SET group_message_id = %s WHERE id = %s",
                     (group_message_id, feedback_id)
                 )
+        self._feedback_cache.pop(feedback_id)
 
     async def get_feedback_by_group_message_id(self, group_message_id: int) -> dict | None:
         async with self.pool.connection() as conn:
@@ -165,27 +307,72 @@ class DB:
                 await cur.execute("SELECT * FROM feedbacks WHERE group_message_id = %s", (group_message_id,))
                 return await cur.fetchone()
 
-    async def add_media(self, feedback_id: int, file_id: str, file_type: str) -> int:
+    async def add_media(self, feedback_id: int, file_id: str, file_type: str,
+                        file_unique_id: str | None = None) -> int:
         """Додає медіа файл до feedback"""
         async with self.pool.connection() as conn:
             async with conn.cursor() as cur:
                 await cur.execute(
-                    "INSERT INTO media (feedback_id, file_id, file_type) VALUES (%s, %s, %s) RETURNING id",
-                    (feedback_id, file_id, file_type)
+                    """INSERT INTO media (feedback_id, file_id, file_type, file_unique_id)
+                    VALUES (%s, %s, %s, %s) RETURNING id""",
+                    (feedback_id, file_id, file_type, file_unique_id)
                 )
                 media_id = (await cur.fetchone())["id"]
+        self._media_cache.pop(feedback_id)
         return media_id
 
     async def get_feedback_media(self, feedback_id: int) -> list:
         """Повертає всі медіа файли для feedback"""
+        media = self._media_cache.get(feedback_id)
+        if media is None:
+            async with self.pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        "SELECT file_id, file_type, file_unique_id FROM media WHERE feedback_id = %s ORDER BY id",
+                        (feedback_id,)
+                    )
+                    rows = await cur.fetchall()
+            media = [{'file_id': row['file_id'], 'file_type': row['file_type'],
+                      'file_unique_id': row['file_unique_id']} for row in rows]
+            self._media_cache.set(feedback_id, media)
+        return [dict(m) for m in media]
+
+    def clear_feedback_cache(self) -> None:
+        """Скидає кеш заявок і медіа (після масового видалення, напр. архівації партицій)"""
+        self._feedback_cache.clear()
+        self._media_cache.clear()
+
+    def cache_stats(self) -> dict:
+        """Влучання/промахи кешу заявок і медіа"""
+        return {
+            name: {"size": len(cache), "hits": cache.hits, "misses": cache.misses}
+            for name, cache in (("feedback", self._feedback_cache), ("media", self._media_cache))
+        }
+
+    async def get_processed_media(self, file_unique_id: str, wm_version: str, profile: str) -> str | None:
+        """Повертає file_id вже обробленого (з водяним знаком) файлу, якщо він є"""
         async with self.pool.connection() as conn:
             async with conn.cursor() as cur:
                 await cur.execute(
-                    "SELECT file_id, file_type FROM media WHERE feedback_id = %s ORDER BY id",
-                    (feedback_id,)
+                    """SELECT file_id FROM processed_media
+                    WHERE file_unique_id = %s AND wm_version = %s AND profile = %s""",
+                    (file_unique_id, wm_version, profile)
+                )
+                row = await cur.fetchone()
+                return row["file_id"] if row else None
+
+    async def save_processed_media(self, file_unique_id: str, wm_version: str, profile: str,
+                                   file_type: str, file_id: str) -> None:
+        """Запам'ятовує file_id, який Telegram видав після першого завантаження обробленого файлу"""
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    """INSERT INTO processed_media (file_unique_id, wm_version, profile, file_type, file_id)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (file_unique_id, wm_version, profile)
+                    DO UPDATE SET file_id = EXCLUDED.file_id, timestamp = CURRENT_TIMESTAMP""",
+                    (file_unique_id, wm_version, profile, file_type, file_id)
                 )
-                rows = await cur.fetchall()
-                return [{'file_id': row['file_id'], 'file_type': row['file_type']} for row in rows] if rows else []
 
     async def get_last_feedback_id(self, user_id: int) -> int | None:
         """Повертає ID останнього feedback від користувача"""
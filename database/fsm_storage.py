@@ -0,0 +1,160 @@
+# database/fsm_storage.py
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from psycopg.types.json import Jsonb
+from config import settings
+from database.cache import TTLCache
+from database.db import db
+
+logger = logging.getLogger(__name__)
+
+_KEY_COLUMNS = "bot_id, chat_id, user_id, thread_id, business_connection_id, destiny"
+_KEY_WHERE = (
+    "bot_id = %s AND chat_id = %s AND user_id = %s AND thread_id = %s "
+    "AND business_connection_id = %s AND destiny = %s"
+)
+# Рядок, який не оновлювали довше за TTL, вважається покинутим: його ніби немає
+_ALIVE = "updated_at > now() - make_interval(secs => %s)"
+
+
+def _key_params(key: StorageKey) -> tuple:
+    return (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id or 0,
+        key.business_connection_id or "", key.destiny,
+    )
+
+
+class PostgresStorage(BaseStorage):
+    """
+    Сховище FSM aiogram у таблиці fsm_states (пул db.pool).
+    Чернетки заявок переживають перезапуск і доступні кільком процесам.
+
+    - стан і дані — один рядок на ключ, дані в JSONB;
+    - розмови без змін довше за state_ttl вважаються покинутими і видаляються у фоні;
+    - читання йдуть через локальний LRU-кеш, запис — одразу в БД і в кеш (write-through).
+      Якщо кілька процесів обробляють того самого користувача без прив'язки до процесу,
+      кеш варто вимкнути (FSM_CACHE_SIZE=0).
+    """
+
+    def __init__(self, state_ttl: float, cache_size: int, cache_ttl: float, sweep_interval: float):
+        self.state_ttl = state_ttl
+        self.sweep_interval = sweep_interval
+        # ключ -> (state, data)
+        self._cache = TTLCache(cache_size, cache_ttl)
+        self._task: asyncio.Task | None = None
+
+    async def _load(self, key: StorageKey) -> tuple[Optional[str], Dict[str, Any]]:
+        record = self._cache.get(key)
+        if record is None:
+            async with db.pool.connection() as conn:
+                cur = await conn.execute(
+                    f"SELECT state, data FROM fsm_states WHERE {_KEY_WHERE} AND {_ALIVE}",
+                    (*_key_params(key), self.state_ttl)
+                )
+                row = await cur.fetchone()
+            record = (row["state"], row["data"]) if row else (None, {})
+            self._cache.set(key, record)
+        return record
+
+    async def _delete(self, key: StorageKey) -> None:
+        async with db.pool.connection() as conn:
+            await conn.execute(f"DELETE FROM fsm_states WHERE {_KEY_WHERE}", _key_params(key))
+        self._cache.set(key, (None, {}))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        cached = self._cache.get(key)
+        if state is None and cached is not None and not cached[1]:
+            # state.clear(): порожній запис не зберігаємо
+            await self._delete(key)
+            return
+
+        # Дані покинутої розмови не воскрешаємо: у простроченого рядка вони скидаються
+        async with db.pool.connection() as conn:
+            cur = await conn.execute(
+                f"""INSERT INTO fsm_states ({_KEY_COLUMNS}, state)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT ({_KEY_COLUMNS}) DO UPDATE SET
+                    state = EXCLUDED.state,
+                    data = CASE WHEN fsm_states.{_ALIVE} THEN fsm_states.data ELSE '{{}}' END,
+                    updated_at = now()
+                RETURNING data""",
+                (*_key_params(key), state, self.state_ttl)
+            )
+            row = await cur.fetchone()
+        self._cache.set(key, (state, row["data"]))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        data = data.copy()
+        cached = self._cache.get(key)
+        if not data and cached is not None and cached[0] is None:
+            await self._delete(key)
+            return
+
+        async with db.pool.connection() as conn:
+            cur = await conn.execute(
+                f"""INSERT INTO fsm_states ({_KEY_COLUMNS}, data)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT ({_KEY_COLUMNS}) DO UPDATE SET
+                    data = EXCLUDED.data,
+                    state = CASE WHEN fsm_states.{_ALIVE} THEN fsm_states.state END,
+                    updated_at = now()
+                RETURNING state""",
+                (*_key_params(key), Jsonb(data), self.state_ttl)
+            )
+            row = await cur.fetchone()
+        self._cache.set(key, (row["state"], data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        # Копія: зміни у хендлері не мають потрапити в кеш
+        return (await self._load(key))[1].copy()
+
+    def cache_stats(self) -> dict:
+        return {"size": len(self._cache), "hits": self._cache.hits, "misses": self._cache.misses}
+
+    # --- прибирання покинутих розмов ---
+
+    async def sweep(self) -> int:
+        """Видаляє прострочені і порожні записи, повертає їх кількість"""
+        async with db.pool.connection() as conn:
+            cur = await conn.execute(
+                f"""DELETE FROM fsm_states
+                WHERE NOT ({_ALIVE}) OR (state IS NULL AND data = '{{}}'::jsonb)""",
+                (self.state_ttl,)
+            )
+            deleted = cur.rowcount
+        if deleted:
+            logger.info(f"🧹 Видалено покинутих станів FSM: {deleted}")
+        return deleted
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"❌ Помилка прибирання станів FSM: {e}")
+            await asyncio.sleep(self.sweep_interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self) -> None:
+        """Зупиняє фонове прибирання; пул БД закривається окремо (db.close)"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+fsm_storage = PostgresStorage(
+    state_ttl=settings.FSM_STATE_TTL,
+    cache_size=settings.FSM_CACHE_SIZE,
+    cache_ttl=settings.FSM_CACHE_TTL,
+    sweep_interval=settings.FSM_SWEEP_INTERVAL,
+)
@@ -0,0 +1,417 @@
+# database/migrations.py
+import re
+import logging
+from typing import NamedTuple
+import psycopg
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    statements: list[str]
+    # CREATE INDEX CONCURRENTLY не можна виконувати в транзакції
+    transactional: bool = True
+
+
+# Перерахунок feedback_stats_daily з feedbacks для `python manage.py backfill-stats`.
+# SHARE-блокування зупиняє вставки на час перерахунку, читання не блокуються.
+# Дні до найстарішої партиції feedbacks вже заархівовані: рядків для них у feedbacks
+# немає, тож їх зведення лишаються як є. Межу беремо з партицій, а не з min(timestamp),
+# інакше при порожній feedbacks зведення живих місяців не очищалось би.
+STATS_BACKFILL: list[str] = [
+    "LOCK TABLE feedbacks IN SHARE MODE",
+    r'''
+    DELETE FROM feedback_stats_daily
+    WHERE day >= COALESCE((
+        SELECT min(to_date(substring(c.relname FROM '^feedbacks_(\d{4}_\d{2})$'), 'YYYY_MM'))
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'feedbacks'::regclass
+    ), '-infinity'::date)
+    ''',
+    '''
+    INSERT INTO feedback_stats_daily (day, category, count)
+    SELECT COALESCE(timestamp, CURRENT_TIMESTAMP)::date, COALESCE(category, ''), COUNT(*)
+    FROM feedbacks
+    GROUP BY 1, 2
+    ''',
+]
+
+# Нумерація тільки зростає. Застосовану міграцію не змінюємо — додаємо нову.
+MIGRATIONS: list[Migration] = [
+    Migration(1, "базова схема", [
+        '''
+        CREATE TABLE IF NOT EXISTS feedbacks (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT,
+            username TEXT,
+            category TEXT,
+            content TEXT,
+            photo_file_id TEXT,
+            video_file_id TEXT,
+            document_file_id TEXT,
+            group_message_id INT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            user_id BIGINT PRIMARY KEY,
+            last_feedback TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS replies (
+            id SERIAL PRIMARY KEY,
+            feedback_id INT REFERENCES feedbacks(id) ON DELETE CASCADE,
+            admin_id BIGINT,
+            reply_text TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS media (
+            id SERIAL PRIMARY KEY,
+            feedback_id INT REFERENCES feedbacks(id) ON DELETE CASCADE,
+            file_id TEXT NOT NULL,
+            file_type TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS processed_media (
+            file_unique_id TEXT NOT NULL,
+            wm_version TEXT NOT NULL,
+            profile TEXT NOT NULL,
+            file_type TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (file_unique_id, wm_version, profile)
+        )
+        ''',
+        # Колонки, які раніше додавались "міграціями на льоту" при кожному старті
+        "ALTER TABLE feedbacks ADD COLUMN IF NOT EXISTS photo_file_id TEXT",
+        "ALTER TABLE feedbacks ADD COLUMN IF NOT EXISTS video_file_id TEXT",
+        "ALTER TABLE feedbacks ADD COLUMN IF NOT EXISTS document_file_id TEXT",
+        "ALTER TABLE feedbacks ADD COLUMN IF NOT EXISTS group_message_id INT",
+        "ALTER TABLE media ADD COLUMN IF NOT EXISTS file_unique_id TEXT",
+    ]),
+    Migration(2, "індекси під запити бота", [
+        # get_stats: фільтр за часом
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_feedbacks_timestamp ON feedbacks (timestamp)",
+        # /news, /ads, /other: category + ORDER BY timestamp DESC
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_feedbacks_category_timestamp ON feedbacks (category, timestamp DESC)",
+        # get_feedback_by_group_message_id
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_feedbacks_group_message_id ON feedbacks (group_message_id)",
+        # get_last_feedback_id: user_id + ORDER BY timestamp DESC
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_feedbacks_user_timestamp ON feedbacks (user_id, timestamp DESC)",
+        # get_feedback_media: feedback_id + ORDER BY id
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_media_feedback_id ON media (feedback_id, id)",
+    ], transactional=False),
+    Migration(3, "щоденна статистика feedback_stats_daily", [
+        '''
+        CREATE TABLE IF NOT EXISTS feedback_stats_daily (
+            day DATE NOT NULL,
+            category TEXT NOT NULL,
+            count BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, category)
+        )
+        ''',
+        # Лічильник оновлюється тригером, тому його не обходить жоден шлях вставки
+        '''
+        CREATE OR REPLACE FUNCTION feedback_stats_daily_track() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO feedback_stats_daily (day, category, count)
+                VALUES (COALESCE(NEW.timestamp, CURRENT_TIMESTAMP)::date, COALESCE(NEW.category, ''), 1)
+                ON CONFLICT (day, category) DO UPDATE SET count = feedback_stats_daily.count + 1;
+                RETURN NEW;
+            END IF;
+            UPDATE feedback_stats_daily SET count = count - 1
+            WHERE day = COALESCE(OLD.timestamp, CURRENT_TIMESTAMP)::date AND category = COALESCE(OLD.category, '');
+            RETURN OLD;
+        END
+        $$
+        ''',
+        "DROP TRIGGER IF EXISTS feedbacks_stats_daily ON feedbacks",
+        '''
+        CREATE TRIGGER feedbacks_stats_daily AFTER INSERT OR DELETE ON feedbacks
+        FOR EACH ROW EXECUTE FUNCTION feedback_stats_daily_track()
+        ''',
+        # Тригер і перерахунок в одній транзакції — жодна вставка не загубиться між ними.
+        # Інструкції зафіксовані як були на момент міграції (не STATS_BACKFILL, який змінювався).
+        "LOCK TABLE feedbacks IN SHARE MODE",
+        "DELETE FROM feedback_stats_daily",
+        '''
+        INSERT INTO feedback_stats_daily (day, category, count)
+        SELECT COALESCE(timestamp, CURRENT_TIMESTAMP)::date, COALESCE(category, ''), COUNT(*)
+        FROM feedbacks
+        GROUP BY 1, 2
+        ''',
+    ]),
+    Migration(4, "стан rate limiter замість rate_limits", [
+        '''
+        CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+            user_id BIGINT NOT NULL,
+            action TEXT NOT NULL,
+            tokens REAL NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL,
+            PRIMARY KEY (user_id, action)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_updated_at ON rate_limit_buckets (updated_at)",
+        # Таблицю оновлював кожен add_feedback, але ніхто її не читав
+        "DROP TABLE IF EXISTS rate_limits",
+    ]),
+    Migration(5, "повнотекстовий пошук і keyset-пагінація заявок", [
+        # Конфігурації 'ukrainian' у стандартному PostgreSQL немає, тому 'simple':
+        # без стемінгу, але однаково працює для будь-якої мови
+        '''
+        ALTER TABLE feedbacks ADD COLUMN IF NOT EXISTS content_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED
+        ''',
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_feedbacks_content_tsv ON feedbacks USING GIN (content_tsv)",
+        # list_feedback: category + id < before_id ORDER BY id DESC
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_feedbacks_category_id ON feedbacks (category, id DESC)",
+    ], transactional=False),
+    Migration(6, "помісячне партиціювання feedbacks, media, replies", [
+        # Створює помісячні партиції трьох таблиць від from_month до to_month включно.
+        # Викликається тут і з фонового обслуговування (database/partitions.py).
+        '''
+        CREATE OR REPLACE FUNCTION ensure_feedback_partitions(from_month date, to_month date)
+        RETURNS int LANGUAGE plpgsql AS $$
+        DECLARE
+            month date := date_trunc('month', from_month)::date;
+            parent text;
+            partition text;
+            created int := 0;
+        BEGIN
+            WHILE month <= to_month LOOP
+                FOREACH parent IN ARRAY ARRAY['feedbacks', 'media', 'replies'] LOOP
+                    partition := parent || '_' || to_char(month, 'YYYY_MM');
+                    IF to_regclass(partition) IS NULL THEN
+                        EXECUTE format(
+                            'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                            partition, parent, month, (month + interval '1 month')::date
+                        );
+                        created := created + 1;
+                    END IF;
+                END LOOP;
+                month := (month + interval '1 month')::date;
+            END LOOP;
+            RETURN created;
+        END
+        $$
+        ''',
+        # Старі таблиці відсуваємо вбік, послідовності id залишаються ті самі
+        "ALTER TABLE feedbacks RENAME TO feedbacks_legacy",
+        "ALTER TABLE media RENAME TO media_legacy",
+        "ALTER TABLE replies RENAME TO replies_legacy",
+        "ALTER SEQUENCE feedbacks_id_seq OWNED BY NONE",
+        "ALTER SEQUENCE media_id_seq OWNED BY NONE",
+        "ALTER SEQUENCE replies_id_seq OWNED BY NONE",
+        '''
+        CREATE TABLE feedbacks (
+            id INT NOT NULL DEFAULT nextval('feedbacks_id_seq'),
+            user_id BIGINT,
+            username TEXT,
+            category TEXT,
+            content TEXT,
+            photo_file_id TEXT,
+            video_file_id TEXT,
+            document_file_id TEXT,
+            group_message_id INT,
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED
+        ) PARTITION BY RANGE (timestamp)
+        ''',
+        # Ключ партиції має входити в PRIMARY KEY, тому зовнішніх ключів на feedbacks(id) більше немає.
+        # media пишеться в одній транзакції з заявкою (той самий timestamp, той самий місяць),
+        # replies — в місяць відповіді; архівуються і видаляються вони помісячно разом із заявками.
+        '''
+        CREATE TABLE media (
+            id INT NOT NULL DEFAULT nextval('media_id_seq'),
+            feedback_id INT NOT NULL,
+            file_id TEXT NOT NULL,
+            file_type TEXT NOT NULL,
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            file_unique_id TEXT
+        ) PARTITION BY RANGE (timestamp)
+        ''',
+        '''
+        CREATE TABLE replies (
+            id INT NOT NULL DEFAULT nextval('replies_id_seq'),
+            feedback_id INT,
+            admin_id BIGINT,
+            reply_text TEXT,
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) PARTITION BY RANGE (timestamp)
+        ''',
+        "ALTER SEQUENCE feedbacks_id_seq OWNED BY feedbacks.id",
+        "ALTER SEQUENCE media_id_seq OWNED BY media.id",
+        "ALTER SEQUENCE replies_id_seq OWNED BY replies.id",
+        '''
+        SELECT ensure_feedback_partitions(
+            LEAST(
+                (SELECT min(timestamp) FROM feedbacks_legacy),
+                (SELECT min(timestamp) FROM media_legacy),
+                (SELECT min(timestamp) FROM replies_legacy),
+                CURRENT_TIMESTAMP
+            )::date,
+            (CURRENT_DATE + interval '3 months')::date
+        )
+        ''',
+        '''
+        INSERT INTO feedbacks (id, user_id, username, category, content, photo_file_id, video_file_id,
+                               document_file_id, group_message_id, timestamp)
+        SELECT id, user_id, username, category, content, photo_file_id, video_file_id,
+               document_file_id, group_message_id, COALESCE(timestamp, CURRENT_TIMESTAMP)
+        FROM feedbacks_legacy
+        ''',
+        # Медіа кладемо в місяць заявки, щоб вони архівувались разом
+        '''
+        INSERT INTO media (id, feedback_id, file_id, file_type, timestamp, file_unique_id)
+        SELECT m.id, m.feedback_id, m.file_id, m.file_type,
+               COALESCE(f.timestamp, m.timestamp, CURRENT_TIMESTAMP), m.file_unique_id
+        FROM media_legacy m LEFT JOIN feedbacks_legacy f ON f.id = m.feedback_id
+        WHERE m.feedback_id IS NOT NULL
+        ''',
+        '''
+        INSERT INTO replies (id, feedback_id, admin_id, reply_text, timestamp)
+        SELECT id, feedback_id, admin_id, reply_text, COALESCE(timestamp, CURRENT_TIMESTAMP)
+        FROM replies_legacy
+        ''',
+        "DROP TABLE replies_legacy, media_legacy, feedbacks_legacy CASCADE",
+        "ALTER TABLE feedbacks ADD PRIMARY KEY (id, timestamp)",
+        "ALTER TABLE media ADD PRIMARY KEY (id, timestamp)",
+        "ALTER TABLE replies ADD PRIMARY KEY (id, timestamp)",
+        # Ті самі індекси, що й у міграціях 2 і 5, тепер на кожній партиції
+        "CREATE INDEX idx_feedbacks_timestamp ON feedbacks (timestamp)",
+        "CREATE INDEX idx_feedbacks_category_timestamp ON feedbacks (category, timestamp DESC)",
+        "CREATE INDEX idx_feedbacks_group_message_id ON feedbacks (group_message_id)",
+        "CREATE INDEX idx_feedbacks_user_timestamp ON feedbacks (user_id, timestamp DESC)",
+        "CREATE INDEX idx_feedbacks_category_id ON feedbacks (category, id DESC)",
+        "CREATE INDEX idx_feedbacks_content_tsv ON feedbacks USING GIN (content_tsv)",
+        "CREATE INDEX idx_media_feedback_id ON media (feedback_id, id)",
+        "CREATE INDEX idx_replies_feedback_id ON replies (feedback_id)",
+        # Зведення статистики: тригер на рівні команди з transition table —
+        # одне оновлення feedback_stats_daily на (день, категорію), а не на кожен рядок,
+        # тож масова вставка не впирається в блокування одного рядка зведення
+        '''
+        CREATE OR REPLACE FUNCTION feedback_stats_daily_apply() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO feedback_stats_daily (day, category, count)
+                SELECT timestamp::date, COALESCE(category, ''), COUNT(*)
+                FROM new_rows GROUP BY 1, 2
+                ON CONFLICT (day, category) DO UPDATE SET count = feedback_stats_daily.count + EXCLUDED.count;
+            ELSE
+                UPDATE feedback_stats_daily s SET count = s.count - d.count
+                FROM (SELECT timestamp::date AS day, COALESCE(category, '') AS category, COUNT(*) AS count
+                      FROM old_rows GROUP BY 1, 2) d
+                WHERE s.day = d.day AND s.category = d.category;
+            END IF;
+            RETURN NULL;
+        END
+        $$
+        ''',
+        '''
+        CREATE TRIGGER feedbacks_stats_daily_insert AFTER INSERT ON feedbacks
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION feedback_stats_daily_apply()
+        ''',
+        '''
+        CREATE TRIGGER feedbacks_stats_daily_delete AFTER DELETE ON feedbacks
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION feedback_stats_daily_apply()
+        ''',
+        "DROP FUNCTION IF EXISTS feedback_stats_daily_track()",
+    ]),
+    Migration(7, "стан FSM (чернетки заявок) у БД", [
+        # Один рядок на ключ aiogram StorageKey: стан і дані разом.
+        # thread_id/business_connection_id без NULL, щоб входити в первинний ключ.
+        '''
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            bot_id BIGINT NOT NULL,
+            chat_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            thread_id BIGINT NOT NULL DEFAULT 0,
+            business_connection_id TEXT NOT NULL DEFAULT '',
+            destiny TEXT NOT NULL DEFAULT 'default',
+            state TEXT,
+            data JSONB NOT NULL DEFAULT '{}',
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (bot_id, chat_id, user_id, thread_id, business_connection_id, destiny)
+        )
+        ''',
+        # Прибирання покинутих розмов: DELETE ... WHERE updated_at < ...
+        "CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states (updated_at)",
+    ]),
+]
+
+# Довільне, але стале число: замок, щоб два процеси не мігрували одночасно
+_ADVISORY_LOCK_KEY = 781_000_001
+
+_INDEX_NAME_RE = re.compile(r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.I)
+
+
+async def _drop_invalid_index(conn: psycopg.AsyncConnection, statement: str) -> None:
+    """Якщо попередній CREATE INDEX CONCURRENTLY обірвався, лишається невалідний індекс,
+    і IF NOT EXISTS його б пропустив. Такий індекс видаляємо перед повторною спробою."""
+    match = _INDEX_NAME_RE.search(statement)
+    if not match:
+        return
+    cur = await conn.execute(
+        """SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s AND NOT i.indisvalid""",
+        (match.group(1),)
+    )
+    if await cur.fetchone():
+        logger.warning(f"⚠️ Невалідний індекс {match.group(1)}, перестворюю")
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}")
+
+
+async def run_migrations(dsn: str) -> None:
+    """Застосовує ще не застосовані міграції по порядку, кожну рівно один раз"""
+    # Окреме з'єднання в autocommit: CONCURRENTLY не працює всередині транзакції,
+    # а з'єднання пулу після нас мають лишитись у звичайному режимі
+    async with await psycopg.AsyncConnection.connect(dsn, autocommit=True) as conn:
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        await conn.execute("SELECT pg_advisory_lock(%s)", (_ADVISORY_LOCK_KEY,))
+        try:
+            cur = await conn.execute("SELECT version FROM schema_version")
+            applied = {row[0] for row in await cur.fetchall()}
+
+            for migration in MIGRATIONS:
+                if migration.version in applied:
+                    continue
+
+                logger.info(f"🗄️ Міграція {migration.version}: {migration.description}")
+                if migration.transactional:
+                    async with conn.transaction():
+                        for statement in migration.statements:
+                            await conn.execute(statement)
+                        await conn.execute(
+                            "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                            (migration.version, migration.description)
+                        )
+                else:
+                    for statement in migration.statements:
+                        await _drop_invalid_index(conn, statement)
+                        await conn.execute(statement)
+                    await conn.execute(
+                        "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                        (migration.version, migration.description)
+                    )
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(%s)", (_ADVISORY_LOCK_KEY,))
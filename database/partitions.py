@@ -0,0 +1,153 @@
+# database/partitions.py
+import asyncio
+import gzip
+import logging
+import os
+import re
+from datetime import date
+import psycopg
+from psycopg import sql
+from config import settings
+from database.db import db
+
+logger = logging.getLogger(__name__)
+
+# Таблиці, партиційовані помісячно за timestamp (міграція 6).
+# Порядок важливий для архівації: заявка йде останньою, після своїх медіа і відповідей.
+PARTITIONED_TABLES = ("media", "replies", "feedbacks")
+
+_PARTITION_RE = re.compile(r"^(\w+)_(\d{4})_(\d{2})$")
+
+
+def _shift_month(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _archive_partition_sync(dsn: str, parent: str, partition: str, path: str) -> None:
+    """
+    Вивантажує партицію у gzip-CSV через COPY і від'єднує її від батьківської таблиці.
+    Все в одній транзакції: поки йде COPY, запис у партицію заблоковано,
+    тож в архів потрапляє рівно те, що буде видалено.
+    """
+    tmp_path = path + ".part"
+    with psycopg.connect(dsn) as conn:
+        with conn.transaction():
+            conn.execute(sql.SQL("LOCK TABLE {} IN SHARE MODE").format(sql.Identifier(partition)))
+            with gzip.open(tmp_path, "wb") as out:
+                with conn.cursor().copy(
+                    sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER)").format(sql.Identifier(partition))
+                ) as copy:
+                    for chunk in copy:
+                        out.write(chunk)
+            # Файл на місці до того, як дані зникнуть з БД
+            os.replace(tmp_path, path)
+            conn.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(
+                sql.Identifier(parent), sql.Identifier(partition)
+            ))
+            conn.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(partition)))
+
+
+class PartitionMaintenance:
+    """
+    Обслуговування помісячних партицій:
+    - заздалегідь створює партиції на months_ahead місяців уперед;
+    - партиції, старші за retention_months, вивантажує в архів (COPY -> .csv.gz) і від'єднує.
+
+    Робоча частина таблиць лишається маленькою: запити за останні дні
+    торкаються однієї-двох партицій, а vacuum не переглядає всю історію.
+    """
+
+    def __init__(self, months_ahead: int, retention_months: int, archive_dir: str, interval: float):
+        self.months_ahead = months_ahead
+        self.retention_months = retention_months
+        self.archive_dir = archive_dir
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    async def ensure_partitions(self) -> int:
+        """Створює відсутні партиції від поточного місяця до months_ahead уперед"""
+        today = date.today()
+        async with db.pool.connection() as conn:
+            cur = await conn.execute(
+                "SELECT ensure_feedback_partitions(%s, %s) AS created",
+                (today, _shift_month(today.replace(day=1), self.months_ahead))
+            )
+            created = (await cur.fetchone())["created"]
+        if created:
+            logger.info(f"🗂️ Створено партицій: {created}")
+        return created
+
+    async def list_partitions(self) -> dict[str, list[date]]:
+        """Місяці, для яких існують партиції, по кожній таблиці"""
+        result = {table: [] for table in PARTITIONED_TABLES}
+        async with db.pool.connection() as conn:
+            cur = await conn.execute(
+                """SELECT p.relname AS parent, c.relname AS partition
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE p.relname = ANY(%s)""",
+                (list(PARTITIONED_TABLES),)
+            )
+            for row in await cur.fetchall():
+                match = _PARTITION_RE.match(row["partition"])
+                if match and match.group(1) == row["parent"]:
+                    result[row["parent"]].append(date(int(match.group(2)), int(match.group(3)), 1))
+        return {table: sorted(months) for table, months in result.items()}
+
+    async def archive_expired(self, retention_months: int | None = None) -> list[str]:
+        """Архівує і від'єднує партиції, старші за retention_months. Повертає шляхи архівів."""
+        retention = self.retention_months if retention_months is None else retention_months
+        if retention <= 0:
+            return []
+
+        cutoff = _shift_month(date.today().replace(day=1), -retention)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        archived = []
+        for table, months in (await self.list_partitions()).items():
+            for month in months:
+                if month >= cutoff:
+                    continue
+                partition = f"{table}_{month:%Y_%m}"
+                path = os.path.join(self.archive_dir, f"{partition}.csv.gz")
+                logger.info(f"📦 Архівую {partition} -> {path}")
+                await asyncio.to_thread(_archive_partition_sync, db.dsn, table, partition, path)
+                archived.append(path)
+
+        if archived:
+            # Видалені заявки могли лежати в кеші DB
+            db.clear_feedback_cache()
+            logger.info(f"✅ Заархівовано партицій: {len(archived)}")
+        return archived
+
+    async def run_once(self) -> None:
+        try:
+            await self.ensure_partitions()
+        except Exception as e:
+            logger.error(f"❌ Не вдалося створити партиції: {e}")
+        try:
+            await self.archive_expired()
+        except Exception as e:
+            logger.error(f"❌ Помилка архівації партицій: {e}")
+
+    async def _loop(self) -> None:
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._loop())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+partition_maintenance = PartitionMaintenance(
+    months_ahead=settings.PARTITION_MONTHS_AHEAD,
+    retention_months=settings.PARTITION_RETENTION_MONTHS,
+    archive_dir=settings.PARTITION_ARCHIVE_DIR,
+    interval=settings.PARTITION_MAINTENANCE_INTERVAL,
+)
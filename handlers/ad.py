@@ -1,4 +1,5 @@
 # handlers/ad.py
+import math
 from typing import List
 from aiogram import Router, F, Bot
 from aiogram.types import Message, CallbackQuery
@@ -7,13 +8,16 @@ from states.feedback_states import FeedbackStates
 from utils.notify_admins import notify_admins
 from keyboards import get_confirm_kb, get_main_menu_kb
 from database.db import db
+from utils.rate_limit import rate_limiter
+from utils.media_files import collect_media_files
 
 router = Router()
 
 @router.message(F.text.in_(["📢 Щодо реклами", "Запит про рекламу"]))
 async def start_ad(message: Message, state: FSMContext):
-    if not await db.check_rate_limit(message.from_user.id):
-        await message.answer("🚫 Будь ласка, зачекай 10 секунд.")
+    wait = rate_limiter.hit(message.from_user.id, "ad")
+    if wait:
+        await message.answer(f"🚫 Будь ласка, зачекай {math.ceil(wait)} с.")
         return
     await state.set_state(FeedbackStates.waiting_for_ad)
     await state.update_data(feedback_type="ad")
@@ -22,21 +26,15 @@ async def start_ad(message: Message, state: FSMContext):
 @router.message(FeedbackStates.waiting_for_ad)
 async def receive_ad(message: Message, state: FSMContext, album: List[Message] = None):
     content = "Без тексту"
-    media_files = [] 
 
     if album:
         for msg in album:
             if msg.caption: content = msg.caption; break
             if msg.text: content = msg.text; break
-        for msg in album:
-            if msg.photo: media_files.append({'file_id': msg.photo[-1].file_id, 'type': 'photo'})
-            elif msg.video: media_files.append({'file_id': msg.video.file_id, 'type': 'video'})
-            elif msg.document: media_files.append({'file_id': msg.document.file_id, 'type': 'document'})
+        media_files = collect_media_files(album)
     else:
         content = message.text or message.caption or "Без тексту"
-        if message.photo: media_files.append({'file_id': message.photo[-1].file_id, 'type': 'photo'})
-        elif message.video: media_files.append({'file_id': message.video.file_id, 'type': 'video'})
-        elif message.document: media_files.append({'file_id': message.document.file_id, 'type': 'document'})
+        media_files = collect_media_files([message])
 
     await state.update_data(content=content, media_files=media_files)
 
@@ -54,8 +52,7 @@ async def confirm_ad(callback: CallbackQuery, state: FSMContext, bot: Bot):
     content = data.get("content", "")
     media_files = data.get("media_files", [])
 
-    feedback_id = await db.add_feedback(callback.from_user.id, username, "реклама", content)
-    for m in media_files: await db.add_media(feedback_id, m['file_id'], m['type'])
+    feedback_id = await db.add_feedback_with_media(callback.from_user.id, username, "реклама", content, media_files)
 
     await notify_admins(
         bot=bot,
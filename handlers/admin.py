@@ -1,17 +1,82 @@
 # handlers/admin.py
+import asyncio
+import html
+import logging
+import os
+import tempfile
+from datetime import date
 from aiogram import Router, F, Bot
-from aiogram.types import CallbackQuery, Message, InputMediaPhoto, InputMediaVideo
+from aiogram.filters import Command, CommandObject
+from aiogram.types import CallbackQuery, Message, InputMediaPhoto, InputMediaVideo, FSInputFile
 from aiogram.fsm.context import FSMContext
-from aiogram.enums import ChatAction
+from aiogram.enums import ChatAction, ParseMode
 from database.db import db
+from database.fsm_storage import fsm_storage
 from config import settings
-from utils.watermark import process_media_for_album
+from utils.watermark import process_album, remember_processed_media
+from utils.fanout import send_media_group_to_all
+from utils.outbound import outbound, send_priority, Priority
 from states.feedback_states import AdminStates
+from keyboards import get_feed_page_kb
+from database.export import export_feedback, EXPORT_FORMATS
+
+logger = logging.getLogger(__name__)
 
 router = Router()
+admin_router = Router()
 
 # --- ПУБЛІКАЦІЯ ---
 
+class PublishProgress:
+    """
+    Прогрес обробки відео в чаті адміна: одне статус-повідомлення, яке редагується.
+    Викликається з event loop як on_progress(index, done, total) для кожного відео альбому;
+    часті виклики зливаються в одне редагування.
+    """
+
+    def __init__(self, bot: Bot, chat_id: int):
+        self.bot = bot
+        self.chat_id = chat_id
+        self._progress: dict[int, tuple[int, int]] = {}
+        self._message_id: int | None = None
+        self._task: asyncio.Task | None = None
+        self._dirty = False
+
+    def __call__(self, index: int, done: int, total: int) -> None:
+        self._progress[index] = (done, total)
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush())
+
+    def _text(self) -> str:
+        done = sum(d for d, _ in self._progress.values())
+        total = sum(t for _, t in self._progress.values())
+        return f"🎬 Обробка відео: {done}/{total} сегментів"
+
+    async def _flush(self) -> None:
+        while self._dirty:
+            self._dirty = False
+            try:
+                if self._message_id is None:
+                    message = await self.bot.send_message(self.chat_id, self._text())
+                    self._message_id = message.message_id
+                else:
+                    await self.bot.edit_message_text(self._text(), chat_id=self.chat_id,
+                                                     message_id=self._message_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Не вдалося оновити прогрес обробки: {e}")
+
+    async def close(self) -> None:
+        """Дочікується останнього оновлення і прибирає статус-повідомлення"""
+        if self._task is not None:
+            await self._task
+        if self._message_id is not None:
+            try:
+                await self.bot.delete_message(self.chat_id, self._message_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Не вдалося видалити статус обробки: {e}")
+
+
 @router.callback_query(F.data.startswith("pub_"))
 async def handle_publish(callback: CallbackQuery, bot: Bot):
     """
@@ -19,28 +84,75 @@ async def handle_publish(callback: CallbackQuery, bot: Bot):
     pub_wm_ID   -> З водяним знаком
     pub_orig_ID -> Без водяного знаку (оригінал)
     """
+    if callback.from_user.id not in settings.ADMIN_IDS:
+        await callback.answer("Тільки для адмінів! 🚫", show_alert=True)
+        return
+
     action, feedback_id = callback.data.split("_")[1], callback.data.split("_")[2]
     feedback_id = int(feedback_id)
-    
-    if not match:
+
+    # Отримуємо дані з БД
+    feedback = await db.get_feedback(feedback_id)
+    if not feedback:
+        await callback.answer("❌ Заявку не знайдено в БД", show_alert=True)
         return
 
-    target_user_id = int(match.group(1))
-    
+    # Відправляємо статус "uploading...", бо це може зайняти час
+    # (Це вирішує п.4 - адмін бачить, що процес іде)
+    await bot.send_chat_action(chat_id=callback.message.chat.id, action=ChatAction.UPLOAD_PHOTO)
+
+    content = feedback["content"]
+    # Якщо контент "Без тексту", прибираємо його для каналу, або лишаємо пустим
+    caption_text = content if content != "Без тексту" else ""
+
+    # Отримуємо медіафайли
+    media_records = await db.get_feedback_media(feedback_id)
+    progress = PublishProgress(bot, callback.message.chat.id)
+
     try:
-        await message.bot.send_message(
-            target_user_id, 
-            f"📬 <b>Відповідь від адміністратора:</b>\n\n{message.text}", 
-            parse_mode=ParseMode.HTML
-        )
-        await message.answer(f"✅ Відповідь надіслана користувачу (ID: {target_user_id})!")
+        if not media_records:
+            # Тільки текст
+            await bot.send_message(settings.CHANNEL_ID, caption_text)
+        else:
+            # Визначаємо, чи потрібна вотермарка
+            use_wm = (action == "wm") # True якщо натиснули "З водяним"
 
-        last_feedback_id = await db.get_last_feedback_id(target_user_id)
-        if last_feedback_id:
-            await db.add_reply(last_feedback_id, message.from_user.id, message.text)
+            # Викликаємо функцію з utils/watermark.py
+            # Вона сама вирішить: качати і обробляти (якщо use_wm=True)
+            # чи просто повернути file_id (якщо use_wm=False).
+            # Всі файли обробляються паралельно, порядок альбому зберігається.
+            # Прогрес довгих відео адмін бачить у статус-повідомленні.
+            try:
+                media_group = await process_album(bot, media_records, use_watermark=use_wm,
+                                                  on_progress=progress)
+            finally:
+                await progress.close()
+
+            # Підпис тільки до першого файлу
+            if caption_text:
+                media_group[0].caption = caption_text
+
+            # Відправляємо в канал (з лімітами і повтором після flood control)
+            delivery, = await send_media_group_to_all(bot, [settings.CHANNEL_ID], media_group)
+            if not delivery.ok:
+                raise RuntimeError(delivery.error)
+            messages = delivery.result
+
+            # Запам'ятовуємо file_id оброблених файлів для повторних публікацій
+            if use_wm:
+                await remember_processed_media(media_records, media_group, messages)
 
+        # Оновлюємо повідомлення у адміна
+        status = "✅ Опубліковано з лого" if action == "wm" else "🚀 Опубліковано оригінал"
+        await callback.message.edit_reply_markup(reply_markup=None)
+        await callback.message.answer(status)
+        
     except Exception as e:
-        await message.answer(f"❌ Не вдалося надіслати відповідь: {e}")
+        await callback.answer(f"Помилка: {e}", show_alert=True)
+        logger.error(f"❌ Помилка публікації заявки #{feedback_id}: {e}")
+        return
+
+    await callback.answer()
 
 # --- АДМІНСЬКІ КОМАНДИ ---
 
@@ -64,129 +176,192 @@ async def cmd_stats(message: Message):
     )
     await message.answer(response, parse_mode=ParseMode.MARKDOWN)
 
-@admin_router.message(Command('news'))
-async def cmd_news_filter(message: Message):
+@admin_router.message(Command('pool'))
+async def cmd_pool(message: Message):
+    """Стан пулу з'єднань з БД: чи не чекають хендлери на з'єднання"""
     if message.from_user.id not in settings.ADMIN_IDS: return
-    async with db.pool.connection() as conn:
-        async with conn.cursor() as cur:
-            await cur.execute("SELECT id, username, content, timestamp FROM feedbacks WHERE category = 'новина' ORDER BY timestamp DESC LIMIT 20")
-            rows = await cur.fetchall()
 
-    if not rows:
-        await message.answer("📰 Немає новин")
+    stats = db.pool_stats()
+    if not stats:
+        await message.answer("🗄️ Пул БД не запущено")
         return
 
-    text = "📰 <b>ОСТАННІ НОВИНИ (макс 20):</b>\n\n"
-    for row in rows:
-        text += f"ID {row['id']} | @{row['username']}\n{row['content'][:100]}...\n\n"
+    queued = stats.get("requests_queued", 0)
+    avg_wait = stats.get("requests_wait_ms", 0) / queued if queued else 0
+    requests = stats.get("requests_num", 0)
+    avg_usage = stats.get("usage_ms", 0) / requests if requests else 0
+
+    text = (
+        f"🗄️ <b>Пул з'єднань БД:</b>\n\n"
+        f"З'єднань: {stats.get('pool_size', 0)} (мін {stats.get('pool_min', 0)}, макс {stats.get('pool_max', 0)})\n"
+        f"Вільних: {stats.get('pool_available', 0)}\n"
+        f"Чекають зараз: {stats.get('requests_waiting', 0)}\n\n"
+        f"Запитів: {requests}, у черзі: {queued}\n"
+        f"Середнє очікування: {avg_wait:.1f} мс\n"
+        f"Середнє використання: {avg_usage:.1f} мс\n"
+        f"Таймаутів/помилок: {stats.get('requests_errors', 0)}\n"
+        f"Втрачених з'єднань: {stats.get('connections_lost', 0)}"
+    )
+    for name, cache in {**db.cache_stats(), "FSM": fsm_storage.cache_stats()}.items():
+        lookups = cache["hits"] + cache["misses"]
+        ratio = cache["hits"] / lookups * 100 if lookups else 0
+        text += f"\nКеш {name}: {cache['size']} записів, влучань {cache['hits']}/{lookups} ({ratio:.0f}%)"
     await message.answer(text)
 
-@admin_router.message(Command('ads'))
-async def cmd_ads_filter(message: Message):
-    if message.from_user.id not in settings.ADMIN_IDS: return
-    async with db.pool.connection() as conn:
-        async with conn.cursor() as cur:
-            await cur.execute("SELECT id, username, content, timestamp FROM feedbacks WHERE category = 'реклама' ORDER BY timestamp DESC LIMIT 20")
-            rows = await cur.fetchall()
+# Стрічки заявок: код у callback_data -> (категорія, заголовок, текст для порожньої стрічки)
+FEEDS = {
+    "n": ("новина", "📰 <b>НОВИНИ</b>", "📰 Немає новин"),
+    "a": ("реклама", "📢 <b>РЕКЛАМА</b>", "📢 Немає реклам"),
+    "o": ("інше", "💬 <b>ІНШІ ПОВІДОМЛЕННЯ</b>", "💬 Немає інших повідомлень"),
+    "s": (None, "🔎 <b>ПОШУК</b>", "🔎 Нічого не знайдено"),
+}
+
+async def send_feed_page(message: Message, feed: str, before_id: int | None = None,
+                         query: str | None = None, edit: bool = False):
+    """Показує сторінку стрічки; edit=True — замінює попередню сторінку в тому ж повідомленні"""
+    category, title, empty_text = FEEDS[feed]
+    rows, next_before_id = await db.list_feedback(category, before_id, query)
 
     if not rows:
-        await message.answer("📢 Немає реклам")
-        return
+        text, kb = empty_text, None
+    else:
+        text = f"{title}" + (f": {html.escape(query)}" if query else "") + "\n\n"
+        for row in rows:
+            text += f"ID {row['id']} | @{html.escape(row['username'] or '')}\n{html.escape((row['content'] or '')[:100])}...\n\n"
+        kb = get_feed_page_kb(feed, next_before_id, first_page=not before_id)
+
+    if edit:
+        await message.edit_text(text, reply_markup=kb)
+    else:
+        await message.answer(text, reply_markup=kb)
+
+@admin_router.message(Command('queue'))
+async def cmd_queue(message: Message):
+    """Стан центральної черги відправок"""
+    if message.from_user.id not in settings.ADMIN_IDS: return
 
-    text = "📢 <b>ОСТАННЯ РЕКЛАМА (макс 20):</b>\n\n"
-    for row in rows:
-        text += f"ID {row['id']} | @{row['username']}\n{row['content'][:100]}...\n\n"
+    stats = outbound.stats()
+    text = f"📮 <b>Черга відправок:</b>\n\nЗараз у роботі: {stats['in_flight']}\n\n"
+    for name in stats["sent"]:
+        text += (
+            f"{name}: чекають {stats['waiting'][name]}, надіслано {stats['sent'][name]}, "
+            f"найдовше очікування {stats['max_wait'][name]:.1f} с\n"
+        )
+    text += f"\nПовторів після flood control: {stats['retries']}"
     await message.answer(text)
 
+@admin_router.message(Command('news'))
+async def cmd_news_filter(message: Message):
+    if message.from_user.id not in settings.ADMIN_IDS: return
+    await send_feed_page(message, "n")
+
+@admin_router.message(Command('ads'))
+async def cmd_ads_filter(message: Message):
+    if message.from_user.id not in settings.ADMIN_IDS: return
+    await send_feed_page(message, "a")
+
 @admin_router.message(Command('other'))
 async def cmd_other_filter(message: Message):
     if message.from_user.id not in settings.ADMIN_IDS: return
-    async with db.pool.connection() as conn:
-        async with conn.cursor() as cur:
-            await cur.execute("SELECT id, username, content, timestamp FROM feedbacks WHERE category = 'інше' ORDER BY timestamp DESC LIMIT 20")
-            rows = await cur.fetchall()
+    await send_feed_page(message, "o")
 
-    if not rows:
-        await message.answer("💬 Немає інших повідомлень")
+@admin_router.message(Command('search'))
+async def cmd_search(message: Message, command: CommandObject, state: FSMContext):
+    if message.from_user.id not in settings.ADMIN_IDS: return
+    query = (command.args or "").strip()
+    if not query:
+        await message.answer('🔎 Використання: /search слова або "точна фраза"')
         return
+    # Запит не влазить у callback_data (64 байти), тому для гортання тримаємо його в FSM
+    await state.update_data(search_query=query)
+    await send_feed_page(message, "s", query=query)
 
-    text = "💬 <b>ІНШІ ПОВІДОМЛЕННЯ (макс 20):</b>\n\n"
-    for row in rows:
-        text += f"ID {row['id']} | @{row['username']}\n{row['content'][:100]}...\n\n"
-    await message.answer(text)
-
-# --- CALLBACKS ---
-
-@admin_router.callback_query(F.data.startswith("reply_to_"))
-async def reply_to_feedback(callback: CallbackQuery, state: FSMContext):
+@admin_router.callback_query(F.data.startswith("feed:"))
+async def feed_page(callback: CallbackQuery, state: FSMContext):
     if callback.from_user.id not in settings.ADMIN_IDS:
         await callback.answer("Тільки для адмінів! 🚫", show_alert=True)
         return
 
-    feedback_id = int(callback.data.replace("reply_to_", ""))
-    # Отримуємо дані з БД
-    feedback = await db.get_feedback(feedback_id)
-    if not feedback:
-        await callback.answer("❌ Заявку не знайдено в БД", show_alert=True)
+    _, feed, before_id = callback.data.split(":")
+    if feed not in FEEDS:
+        await callback.answer()
         return
+    query = None
+    if feed == "s":
+        query = (await state.get_data()).get("search_query")
+        if not query:
+            await callback.answer("Пошук застарів, повторіть /search", show_alert=True)
+            return
+
+    await send_feed_page(callback.message, feed, int(before_id) or None, query, edit=True)
+    await callback.answer()
 
-    # Відправляємо статус "uploading...", бо це може зайняти час
-    # (Це вирішує п.4 - адмін бачить, що процес іде)
-    await bot.send_chat_action(chat_id=callback.message.chat.id, action=ChatAction.UPLOAD_PHOTO)
+# Telegram не приймає від бота документи, більші за 50 МБ
+EXPORT_MAX_UPLOAD = 50 * 1024 * 1024
 
-    content = feedback["content"]
-    # Якщо контент "Без тексту", прибираємо його для каналу, або лишаємо пустим
-    caption_text = content if content != "Без тексту" else ""
+@admin_router.message(Command('export'))
+async def cmd_export(message: Message, command: CommandObject):
+    """
+    /export [csv|jsonl] [з YYYY-MM-DD] [по YYYY-MM-DD] [новина|реклама|інше]
+    Параметри в будь-якому порядку; перша дата — початок, друга — кінець.
+    """
+    if message.from_user.id not in settings.ADMIN_IDS: return
 
-    # Отримуємо медіафайли
-    media_records = await db.get_feedback_media(feedback_id)
-    
-    try:
-        if not media_records:
-            # Тільки текст
-            await bot.send_message(settings.CHANNEL_ID, caption_text)
+    fmt, dates, category = "csv", [], None
+    categories = {code: cat for code, (cat, _, _) in FEEDS.items() if cat}
+    for arg in (command.args or "").split():
+        if arg.lower() in EXPORT_FORMATS:
+            fmt = arg.lower()
+        elif arg in categories.values():
+            category = arg
         else:
-            # Формуємо альбом
-            media_group = []
-            
-            # Визначаємо, чи потрібна вотермарка
-            use_wm = (action == "wm") # True якщо натиснули "З водяним"
-
-            for i, file_info in enumerate(media_records):
-                # Викликаємо функцію з utils/watermark.py
-                # Вона сама вирішить: качати і обробляти (якщо use_wm=True)
-                # чи просто повернути file_id (якщо use_wm=False)
-                input_media = await process_media_for_album(
-                    bot=bot,
-                    file_id=file_info['file_id'],
-                    file_type=file_info['file_type'],
-                    use_watermark=use_wm 
+            try:
+                dates.append(date.fromisoformat(arg))
+            except ValueError:
+                await message.answer(
+                    "📤 Використання: /export [csv|jsonl] [з YYYY-MM-DD] [по YYYY-MM-DD] [новина|реклама|інше]"
                 )
-                
-                # Підпис тільки до першого файлу
-                if i == 0 and caption_text:
-                    input_media.caption = caption_text
-
-                media_group.append(input_media)
+                return
+    date_from = dates[0] if dates else None
+    date_to = dates[1] if len(dates) > 1 else None
 
-            # Відправляємо в канал
-            await bot.send_media_group(settings.CHANNEL_ID, media=media_group)
+    await message.answer("📤 Готую експорт...")
+    await message.bot.send_chat_action(chat_id=message.chat.id, action=ChatAction.UPLOAD_DOCUMENT)
 
-        # Оновлюємо повідомлення у адміна
-        status = "✅ Опубліковано з лого" if action == "wm" else "🚀 Опубліковано оригінал"
-        await callback.message.edit_reply_markup(reply_markup=None)
-        await callback.message.answer(status)
-        
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}.gz")
+    os.close(fd)
+    try:
+        rows = await export_feedback(path, fmt, date_from, date_to, category)
+        size = os.path.getsize(path)
+        if size > EXPORT_MAX_UPLOAD:
+            await message.answer(
+                f"❌ Файл завеликий для Telegram ({size / 1024 / 1024:.0f} МБ, {rows} заявок). "
+                f"Звузьте період або скористайтесь `python manage.py export`."
+            )
+            return
+
+        period = f"{date_from or '…'} — {date_to or '…'}"
+        # Великий файл не повинен займати слот, потрібний для відповідей користувачам
+        with send_priority(Priority.BULK):
+            await message.answer_document(
+                FSInputFile(path, filename=f"feedbacks_{date.today():%Y%m%d}.{fmt}.gz"),
+                caption=f"📤 Заявок: {rows}\nПеріод: {period}" + (f"\nКатегорія: {category}" if category else ""),
+            )
     except Exception as e:
-        await callback.answer(f"Помилка: {e}", show_alert=True)
-        print(f"Publish error: {e}")
+        await message.answer(f"❌ Помилка експорту: {e}")
+    finally:
+        os.remove(path)
 
-    await callback.answer()
+# --- CALLBACKS ---
 
 # --- ВІДПОВІДЬ КОРИСТУВАЧУ ---
 
 @router.callback_query(F.data.startswith("reply_to_"))
 async def start_reply(callback: CallbackQuery, state: FSMContext):
+    if callback.from_user.id not in settings.ADMIN_IDS:
+        await callback.answer("Тільки для адмінів! 🚫", show_alert=True)
+        return
+
     feedback_id = int(callback.data.split("_")[2])
     await state.update_data(current_feedback_id=feedback_id)
     await state.set_state(AdminStates.replying)
@@ -218,5 +393,9 @@ async def send_reply(message: Message, state: FSMContext, bot: Bot):
 
 @router.callback_query(F.data.startswith("reject_"))
 async def reject_post(callback: CallbackQuery):
+    if callback.from_user.id not in settings.ADMIN_IDS:
+        await callback.answer("Тільки для адмінів! 🚫", show_alert=True)
+        return
+
     await callback.message.edit_text(f"{callback.message.text}\n\n❌ <b>ВІДХИЛЕНО</b>", parse_mode="HTML", reply_markup=None)
     await callback.answer("Відхилено")
@@ -6,7 +6,9 @@ from keyboards import get_main_menu_kb, get_start_kb
 from config import settings
 from database.db import db
 from utils.notify_admins import notify_admins
+from utils.rate_limit import rate_limiter
 import logging
+import math
 
 # Налаштовуємо логер для цього файлу
 logger = logging.getLogger(__name__)
@@ -73,7 +75,7 @@ async def cmd_help_button(message: Message):
         "<b>💬 Інше повідомлення:</b>\n"
         "Питання, пропозиції, критика - поділись з нами!\n\n"
         "<b>⏱️ Обмеження:</b>\n"
-        "Одне повідомлення на 1 хвилину (Антиспам)\n\n"
+        "Кілька повідомлень поспіль, далі — пауза (Антиспам)\n\n"
         "<b>❓ Питання?</b>\n"
         "Напиши /help для довідки"
     )
@@ -91,13 +93,17 @@ async def cmd_help(message: Message):
         "<b>💬 Інше повідомлення:</b>\n"
         "Питання, пропозиції, критика - поділись з нами!\n\n"
         "<b>⏱️ Обмеження:</b>\n"
-        "Одне повідомлення на 1 хвилину (Антиспам)\n\n"
+        "Кілька повідомлень поспіль, далі — пауза (Антиспам)\n\n"
         "<b>Команди адмінів:</b>\n"
         "/stats - аналітика\n"
         "/id - твій ID\n"
         "/news - новини\n"
         "/ads - реклама\n"
-        "/other - інше"
+        "/other - інше\n"
+        "/search - пошук по заявках\n"
+        "/export - вивантаження заявок\n"
+        "/pool - стан пулу БД\n"
+        "/queue - черга відправок"
     )
     await message.answer(help_text, reply_markup=get_main_menu_kb())
 
@@ -115,8 +121,9 @@ async def handle_direct_message(message: Message, bot: Bot):
          return
 
     try:
-        if not await db.check_rate_limit(message.from_user.id):
-            await message.answer("Зачекай 1 хвилину перед наступною відправкою 🚫")
+        wait = rate_limiter.hit(message.from_user.id, "direct")
+        if wait:
+            await message.answer(f"Зачекай {math.ceil(wait)} с перед наступною відправкою 🚫")
             return
 
         username = message.from_user.username or "Без імені"
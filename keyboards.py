@@ -51,3 +51,14 @@ def get_quick_replies_kb() -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text=quick_replies[4][0], callback_data=quick_replies[4][1])],
     ])
     return kb
+
+def get_feed_page_kb(feed: str, next_before_id: int | None, first_page: bool) -> InlineKeyboardMarkup | None:
+    """Гортання стрічки заявок в адмінці: feed — код стрічки (n/a/o/s)"""
+    buttons = []
+    if not first_page:
+        buttons.append(InlineKeyboardButton(text="⏮ Спочатку", callback_data=f"feed:{feed}:0"))
+    if next_before_id:
+        buttons.append(InlineKeyboardButton(text="▶️ Далі", callback_data=f"feed:{feed}:{next_before_id}"))
+    if not buttons:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
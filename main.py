@@ -2,7 +2,6 @@ import asyncio
 import logging
 import sys
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
@@ -14,10 +13,16 @@ from handlers.start import router as start_router
 from handlers.news import router as news_router
 from handlers.ad import router as ad_router
 from handlers.other import router as other_router
-from handlers.admin import admin_router
+from handlers.admin import admin_router, router as admin_callbacks_router
 
 # Middleware
 from utils.album_middleware import AlbumMiddleware
+from utils.image_pool import image_pool
+from utils.rate_limit import rate_limiter
+from utils.outbound import outbound
+from utils.webhook import run_webhook
+from database.partitions import partition_maintenance
+from database.fsm_storage import fsm_storage
 
 async def main():
     # Налаштування логування: додаємо час і рівень важливості
@@ -42,6 +47,13 @@ async def main():
         logger.critical("💡 Перевірте файл .env та переконайтесь, що всі змінні встановлені")
         return
 
+    if settings.BOT_MODE not in ("polling", "webhook"):
+        logger.critical(f"❌ Невідомий BOT_MODE: {settings.BOT_MODE} (очікується polling або webhook)")
+        return
+    if settings.BOT_MODE == "webhook" and not settings.WEBHOOK_SECRET:
+        logger.critical("❌ Для режиму webhook потрібен WEBHOOK_SECRET")
+        return
+
     # Підключення до БД
     try:
         await db.connect()
@@ -50,12 +62,26 @@ async def main():
         # Без бази бот не має сенсу, тому зупиняємо
         return
 
+    # Партиції наперед і архівація старих — у фоні
+    partition_maintenance.start()
+
+    # Антиспам: відновлюємо ліміти з БД і зберігаємо їх у фоні
+    await rate_limiter.start()
+
+    # Процеси для обробки фото стартують у фоні, поки бот готується
+    image_pool.start()
+
     bot = Bot(
         token=settings.BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
 
-    dp = Dispatcher(storage=MemoryStorage())
+    # Всі bot.send_* проходять через центральну чергу з пріоритетами і лімітами Telegram
+    outbound.install(bot)
+
+    # Стан FSM (чернетки заявок) у БД: переживає перезапуск, покинуті розмови прибираються у фоні
+    fsm_storage.start()
+    dp = Dispatcher(storage=fsm_storage)
 
     # Підключення AlbumMiddleware для обробки медіа-груп
     album_middleware = AlbumMiddleware(latency=0.5)
@@ -65,8 +91,9 @@ async def main():
     logger.info("📦 AlbumMiddleware підключено")
 
     # Підключення роутерів (порядок важливий!)
-    # Спочатку admin (щоб перехоплювати команди адміна), потім інші
-    dp.include_routers(admin_router, start_router, news_router, ad_router, other_router)
+    # Спочатку admin (щоб перехоплювати команди адміна), потім кнопки адміна
+    # (публікація, відповідь, відхилення), потім інші
+    dp.include_routers(admin_router, admin_callbacks_router, start_router, news_router, ad_router, other_router)
 
     # Обробник необроблених оновлень (завжди останній!)
     @dp.update()
@@ -83,36 +110,44 @@ async def main():
         else:
             logger.info(f"  Тип: {type(update)}")
 
-    logger.info("🗑️ Очищення черги старих оновлень...")
-    # Це критично важливо, якщо бот довго не працював або "завис"
-    try:
-        await bot.delete_webhook(drop_pending_updates=True)
-        logger.info("✅ Webhook видалено (якщо був встановлений)")
-
-        # Додаткова затримка, щоб Telegram обробив видалення
-        await asyncio.sleep(2)
-
-        # Перевіряємо чи можемо отримувати оновлення
-        logger.info("🔄 Тестування з'єднання...")
-        await bot.get_me()
-    except Exception as e:
-        logger.error(f"⚠️ Помилка при підготовці: {e}")
-        if "Conflict" in str(e):
-            logger.critical("🚨 КОНФЛІКТ: Інший екземпляр бота вже запущений!")
-            logger.critical("   Зупиніть всі інші екземпляри та спробуйте знову")
-            await bot.session.close()
-            return
+    if settings.BOT_MODE == "polling":
+        logger.info("🗑️ Очищення черги старих оновлень...")
+        # Це критично важливо, якщо бот довго не працював або "завис"
+        try:
+            await bot.delete_webhook(drop_pending_updates=True)
+            logger.info("✅ Webhook видалено (якщо був встановлений)")
+
+            # Додаткова затримка, щоб Telegram обробив видалення
+            await asyncio.sleep(2)
+
+            # Перевіряємо чи можемо отримувати оновлення
+            logger.info("🔄 Тестування з'єднання...")
+            await bot.get_me()
+        except Exception as e:
+            logger.error(f"⚠️ Помилка при підготовці: {e}")
+            if "Conflict" in str(e):
+                logger.critical("🚨 КОНФЛІКТ: Інший екземпляр бота вже запущений!")
+                logger.critical("   Зупиніть всі інші екземпляри та спробуйте знову")
+                await bot.session.close()
+                return
 
     logger.info("✅ Бот запущений! Очікую повідомлень...")
 
     try:
-        await dp.start_polling(bot)
+        if settings.BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
     except Exception as e:
-        logger.error(f"❌ Помилка в процесі роботи (polling): {e}")
+        logger.error(f"❌ Помилка в процесі роботи ({settings.BOT_MODE}): {e}")
     finally:
         # Коректне завершення роботи
+        image_pool.shutdown()
+        await rate_limiter.stop()
+        partition_maintenance.stop()
+        await fsm_storage.close()
         if hasattr(db, 'pool') and db.pool:
-            await db.pool.close()
+            await db.close()
             logger.info("🛑 З'єднання з БД закрито.")
         logger.info("👋 Бот зупинений.")
 
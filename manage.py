@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Службові команди для обслуговування бота
+
+    python manage.py backfill-stats    # перерахувати feedback_stats_daily з feedbacks
+    python manage.py partitions        # створити партиції наперед
+    python manage.py archive --months 12   # заархівувати і від'єднати партиції, старші за 12 місяців
+    python manage.py export -o news.jsonl.gz --format jsonl --from 2026-01-01 --category новина
+    python manage.py replay-updates updates.jsonl   # надіслати записані оновлення на локальний webhook
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from datetime import date
+
+import aiohttp
+
+from database.db import db
+from database.partitions import partition_maintenance
+from database.export import export_feedback, EXPORT_FORMATS
+from config import settings
+from utils.webhook import SECRET_HEADER
+
+
+async def backfill_stats(args: argparse.Namespace) -> None:
+    rows = await db.backfill_stats()
+    print(f"✅ Статистику перераховано: {rows} рядків (день × категорія)")
+
+
+async def partitions(args: argparse.Namespace) -> None:
+    created = await partition_maintenance.ensure_partitions()
+    for table, months in (await partition_maintenance.list_partitions()).items():
+        span = f"{months[0]:%Y-%m} … {months[-1]:%Y-%m}" if months else "немає"
+        print(f"🗂️ {table}: {len(months)} партицій ({span})")
+    print(f"✅ Створено нових: {created}")
+
+
+async def archive(args: argparse.Namespace) -> None:
+    paths = await partition_maintenance.archive_expired(args.months)
+    for path in paths:
+        print(f"📦 {path}")
+    print(f"✅ Заархівовано партицій: {len(paths)}")
+
+
+async def export(args: argparse.Namespace) -> None:
+    rows = await export_feedback(args.output, args.format, args.date_from, args.date_to, args.category)
+    print(f"✅ Експортовано заявок: {rows} -> {args.output}")
+
+
+async def replay_updates(args: argparse.Namespace) -> None:
+    url = args.url or f"http://127.0.0.1:{settings.WEBHOOK_PORT}{settings.WEBHOOK_PATH}"
+    headers = {SECRET_HEADER: settings.WEBHOOK_SECRET}
+    statuses: dict[int, int] = {}
+    async with aiohttp.ClientSession() as session:
+        with open(args.file, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                async with session.post(url, json=json.loads(line), headers=headers) as response:
+                    statuses[response.status] = statuses.get(response.status, 0) + 1
+    for status, count in sorted(statuses.items()):
+        print(f"📨 HTTP {status}: {count}")
+
+
+COMMANDS = {
+    "backfill-stats": backfill_stats,
+    "partitions": partitions,
+    "archive": archive,
+    "export": export,
+    "replay-updates": replay_updates,
+}
+
+# Команди, яким не потрібне підключення до БД
+NO_DB_COMMANDS = {"replay-updates"}
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Службові команди бота")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("backfill-stats", help="перерахувати щоденну статистику з feedbacks")
+    subparsers.add_parser("partitions", help="створити партиції наперед і показати наявні")
+    archive_parser = subparsers.add_parser("archive", help="заархівувати старі партиції")
+    archive_parser.add_argument("--months", type=int, default=None,
+                                help="скільки місяців зберігати (за замовчуванням PARTITION_RETENTION_MONTHS)")
+    export_parser = subparsers.add_parser("export", help="вивантажити заявки з медіа і відповідями (gzip)")
+    export_parser.add_argument("-o", "--output", required=True, help="файл, напр. feedbacks.csv.gz")
+    export_parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    export_parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="з дати (YYYY-MM-DD)")
+    export_parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="по дату включно")
+    export_parser.add_argument("--category", help="новина, реклама або інше")
+    replay_parser = subparsers.add_parser("replay-updates", help="надіслати записані оновлення (JSONL) на webhook")
+    replay_parser.add_argument("file", help="JSONL з оновленнями, напр. з WEBHOOK_RECORD_PATH")
+    replay_parser.add_argument("--url", help="адреса webhook (за замовчуванням локальний WEBHOOK_PORT/WEBHOOK_PATH)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(name)s - %(message)s", stream=sys.stdout)
+
+    if args.command in NO_DB_COMMANDS:
+        await COMMANDS[args.command](args)
+        return 0
+
+    await db.connect()
+    try:
+        await COMMANDS[args.command](args)
+    finally:
+        await db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,11 @@
+# tests/conftest.py
+import os
+import sys
+
+# config.Settings вимагає ці змінні; для тестів достатньо заглушок
+os.environ.setdefault("BOT_TOKEN", "1:test")
+os.environ.setdefault("CHANNEL_ID", "-100")
+os.environ.setdefault("ADMIN_IDS", "[1]")
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
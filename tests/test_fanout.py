@@ -0,0 +1,92 @@
+# tests/test_fanout.py
+import asyncio
+import time
+import pytest
+from aiohttp import ClientConnectorError, ServerDisconnectedError
+from aiohttp.client_reqrep import ConnectionKey
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+from utils.fanout import FanOut, TokenBucket
+
+METHOD = SendMessage(chat_id=1, text="x")
+
+
+def test_token_bucket_burst_then_rate():
+    bucket = TokenBucket(rate=10, capacity=3)
+    # Перші capacity запитів без очікування, далі — по 1/rate секунди кожен
+    delays = [bucket.reserve() for _ in range(5)]
+    assert delays[:3] == [0.0, 0.0, 0.0]
+    assert delays[3] == pytest.approx(0.1, abs=0.01)
+    assert delays[4] == pytest.approx(0.2, abs=0.01)
+
+
+def test_token_bucket_refills_up_to_capacity():
+    bucket = TokenBucket(rate=100, capacity=2)
+    bucket.reserve(), bucket.reserve()
+    bucket.stamp -= 10  # «минуло» 10 с — баланс не більший за capacity
+    assert [bucket.reserve() for _ in range(2)] == [0.0, 0.0]
+    assert bucket.reserve() > 0
+
+
+def test_token_bucket_block_and_available_in():
+    bucket = TokenBucket(rate=1, capacity=1)
+    assert bucket.available_in() == 0.0
+    bucket.block(2)
+    assert bucket.available_in() == pytest.approx(2, abs=0.05)
+    # available_in не резервує
+    assert bucket.tokens == 1
+    assert bucket.reserve() == pytest.approx(2, abs=0.05)
+
+
+def _network_error(cause: Exception) -> TelegramNetworkError:
+    try:
+        raise cause
+    except Exception:
+        try:
+            raise TelegramNetworkError(method=METHOD, message=str(cause))
+        except TelegramNetworkError as e:
+            return e
+
+
+def _call(fanout: FanOut, errors: list[Exception]) -> tuple[int, object]:
+    attempts = 0
+
+    async def request():
+        nonlocal attempts
+        attempts += 1
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    try:
+        result = asyncio.run(fanout.call(1, request))
+    except Exception as e:
+        result = e
+    return attempts, result
+
+
+def test_retry_after_retried_when_pacing_itself():
+    fanout = FanOut(global_rate=100, chat_rate=100, chat_burst=10, max_retries=3)
+    attempts, result = _call(fanout, [TelegramRetryAfter(METHOD, "flood", 0)])
+    assert (attempts, result) == (2, "ok")
+
+
+def test_retry_after_not_retried_under_scheduler():
+    fanout = FanOut(global_rate=100, chat_rate=100, chat_burst=10, max_retries=3)
+    fanout.pace = False
+    attempts, result = _call(fanout, [TelegramRetryAfter(METHOD, "flood", 0)])
+    assert attempts == 1 and isinstance(result, TelegramRetryAfter)
+
+
+def test_network_error_retried_only_if_never_sent():
+    fanout = FanOut(global_rate=100, chat_rate=100, chat_burst=10, max_retries=3)
+    refused = ClientConnectorError(ConnectionKey("api.telegram.org", 443, True, None, None, None, None),
+                                   OSError(111, "refused"))
+    attempts, result = _call(fanout, [_network_error(refused)])
+    assert (attempts, result) == (2, "ok")
+
+    # Обрив після відправки: альбом міг уже дійти, повтор дав би дубль
+    attempts, result = _call(fanout, [_network_error(ServerDisconnectedError())])
+    assert attempts == 1 and isinstance(result, TelegramNetworkError)
+    attempts, result = _call(fanout, [_network_error(asyncio.TimeoutError())])
+    assert attempts == 1 and isinstance(result, TelegramNetworkError)
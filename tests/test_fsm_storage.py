@@ -0,0 +1,142 @@
+# tests/test_fsm_storage.py
+import asyncio
+import psycopg
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+from config import settings
+from database import cache as cache_module
+from database.cache import TTLCache
+from database.db import db
+from database.fsm_storage import PostgresStorage
+
+# Окремий bot_id, щоб тести не зачіпали справжні стани
+BOT_ID = 999_000_001
+KEY = StorageKey(bot_id=BOT_ID, chat_id=5, user_id=5)
+
+
+# --- TTLCache (без БД) ---
+
+def test_ttl_cache_expires_and_evicts_least_recent(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    cache = TTLCache(max_size=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" стає найсвіжішим
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+    now[0] += 11
+    assert cache.get("a") is None
+    assert len(cache) == 1
+    assert (cache.hits, cache.misses) == (3, 2)
+
+
+def test_ttl_cache_disabled_with_zero_size():
+    cache = TTLCache(max_size=0, ttl=10)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+# --- PostgresStorage (потрібна БД з DATABASE_URL) ---
+
+@pytest.fixture(scope="module")
+def database_available():
+    try:
+        psycopg.connect(settings.DATABASE_URL, connect_timeout=2).close()
+    except Exception as e:
+        pytest.skip(f"PostgreSQL недоступна: {e}")
+
+
+def _run(scenario):
+    """Пул прив'язаний до event loop, тому відкривається і закривається в кожному тесті"""
+    async def wrapper():
+        await db.connect()
+        try:
+            async with db.pool.connection() as conn:
+                await conn.execute("DELETE FROM fsm_states WHERE bot_id = %s", (BOT_ID,))
+            return await scenario()
+        finally:
+            async with db.pool.connection() as conn:
+                await conn.execute("DELETE FROM fsm_states WHERE bot_id = %s", (BOT_ID,))
+            await db.close()
+
+    return asyncio.run(wrapper())
+
+
+def _storage(cache_size: int = 100, state_ttl: float = 3600) -> PostgresStorage:
+    return PostgresStorage(state_ttl=state_ttl, cache_size=cache_size, cache_ttl=60, sweep_interval=3600)
+
+
+async def _age_row(seconds: int) -> None:
+    async with db.pool.connection() as conn:
+        await conn.execute(
+            "UPDATE fsm_states SET updated_at = now() - make_interval(secs => %s) WHERE bot_id = %s",
+            (seconds, BOT_ID)
+        )
+
+
+def test_state_and_data_visible_to_another_process(database_available):
+    async def scenario():
+        writer, reader = _storage(), _storage(cache_size=0)
+        await writer.set_state(KEY, "Form:text")
+        await writer.set_data(KEY, {"text": "hi"})
+        return await reader.get_state(KEY), await reader.get_data(KEY)
+
+    assert _run(scenario) == ("Form:text", {"text": "hi"})
+
+
+def test_cache_is_write_through_and_returns_copies(database_available):
+    async def scenario():
+        storage = _storage()
+        await storage.set_data(KEY, {"items": 1})
+        misses = storage.cache_stats()["misses"]
+        data = await storage.get_data(KEY)
+        data["items"] = 2  # зміна у хендлері без set_data
+        cached = await storage.get_data(KEY)
+        # Читання пішли з кешу, а не з БД
+        async with db.pool.connection() as conn:
+            await conn.execute("UPDATE fsm_states SET data = '{\"items\": 3}' WHERE bot_id = %s", (BOT_ID,))
+        return cached, await storage.get_data(KEY), storage.cache_stats()["misses"] - misses
+
+    cached, still_cached, misses = _run(scenario)
+    assert cached == {"items": 1}
+    assert still_cached == {"items": 1}
+    assert misses == 0
+
+
+def test_expired_conversation_is_not_resurrected(database_available):
+    async def scenario():
+        storage = _storage(cache_size=0, state_ttl=60)
+        await storage.set_state(KEY, "Form:text")
+        await storage.set_data(KEY, {"draft": "old"})
+        await _age_row(120)
+        expired = await storage.get_state(KEY), await storage.get_data(KEY)
+        # Нова розмова на простроченому рядку починається з порожніх даних
+        await storage.set_state(KEY, "Form:photo")
+        fresh = await storage.get_data(KEY)
+        await _age_row(120)
+        swept = await storage.sweep()
+        return expired, fresh, swept
+
+    expired, fresh, swept = _run(scenario)
+    assert expired == (None, {})
+    assert fresh == {}
+    assert swept == 1
+
+
+def test_clear_deletes_row(database_available):
+    async def scenario():
+        storage = _storage()
+        await storage.set_state(KEY, "Form:text")
+        await storage.set_data(KEY, {"draft": "x"})
+        # state.clear() у aiogram: set_data({}), потім set_state(None)
+        await storage.set_data(KEY, {})
+        await storage.set_state(KEY, None)
+        async with db.pool.connection() as conn:
+            cur = await conn.execute("SELECT count(*) AS n FROM fsm_states WHERE bot_id = %s", (BOT_ID,))
+            return (await cur.fetchone())["n"], await storage.get_state(KEY)
+
+    assert _run(scenario) == (0, None)
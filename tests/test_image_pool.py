@@ -0,0 +1,63 @@
+# tests/test_image_pool.py
+import asyncio
+import os
+import time
+import pytest
+from utils.image_pool import ImageWorkerPool
+
+
+def sleep_and_pid(seconds: float) -> int:
+    time.sleep(seconds)
+    return os.getpid()
+
+
+def fail(message: str) -> None:
+    raise ValueError(message)
+
+
+def crash() -> None:
+    os._exit(3)
+
+
+@pytest.fixture
+def pool():
+    pool = ImageWorkerPool(workers=2, queue_size=2, timeout=1.5, preload=("tests.test_image_pool",))
+    yield pool
+    pool.shutdown()
+
+
+def test_hung_job_does_not_break_others(pool):
+    async def main():
+        hung = asyncio.ensure_future(pool.run(sleep_and_pid, 30))
+        await asyncio.sleep(0.3)
+        healthy = await pool.run(sleep_and_pid, 0.9)
+        with pytest.raises(asyncio.TimeoutError):
+            await hung
+        # Після таймауту пул працює далі
+        return healthy, await pool.run(sleep_and_pid, 0)
+
+    started = time.monotonic()
+    healthy, after = asyncio.run(main())
+    assert healthy > 0 and after > 0
+    assert time.monotonic() - started < 5
+    assert pool._slots._value == 4
+
+
+def test_job_errors_are_raised(pool):
+    with pytest.raises(ValueError, match="погане фото"):
+        asyncio.run(pool.run(fail, "погане фото"))
+    with pytest.raises(RuntimeError, match="аварійно"):
+        asyncio.run(pool.run(crash))
+
+
+def test_thread_mode_holds_slot_until_thread_ends():
+    pool = ImageWorkerPool(workers=0, queue_size=0, timeout=0.2)
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.run(sleep_and_pid, 0.6)
+        assert pool._slots._value == 0
+        await asyncio.sleep(0.6)
+        assert pool._slots._value == 1
+
+    asyncio.run(main())
@@ -0,0 +1,25 @@
+# tests/test_media_files.py
+from types import SimpleNamespace
+from utils.media_files import collect_media_files
+
+
+def _message(photo=None, video=None, document=None):
+    return SimpleNamespace(photo=photo, video=video, document=document)
+
+
+def _file(file_id):
+    return SimpleNamespace(file_id=file_id, file_unique_id=f"u-{file_id}")
+
+
+def test_collect_media_files_keeps_order_and_skips_text():
+    messages = [
+        _message(photo=[_file("small"), _file("big")]),
+        _message(),
+        _message(video=_file("v")),
+        _message(document=_file("d")),
+    ]
+    assert collect_media_files(messages) == [
+        {'file_id': "big", 'file_unique_id': "u-big", 'type': 'photo'},
+        {'file_id': "v", 'file_unique_id': "u-v", 'type': 'video'},
+        {'file_id': "d", 'file_unique_id': "u-d", 'type': 'document'},
+    ]
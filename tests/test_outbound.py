@@ -0,0 +1,125 @@
+# tests/test_outbound.py
+import asyncio
+import time
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetMe, SendMessage
+from utils.fanout import TokenBucket
+from utils.outbound import OutboundScheduler, Priority, _PriorityGate
+
+
+def _gate(slots: int, background_slots: int, rate: float = 1000.0) -> _PriorityGate:
+    return _PriorityGate(slots, background_slots, TokenBucket(rate, rate))
+
+
+def test_freed_slot_goes_to_most_urgent_waiter():
+    async def scenario():
+        gate = _gate(slots=1, background_slots=1)
+        await gate.acquire(Priority.REPLY)
+        order = []
+
+        async def waiter(priority):
+            await gate.acquire(priority)
+            order.append(priority)
+            gate.release(priority)
+
+        tasks = []
+        for priority in (Priority.BULK, Priority.CHANNEL, Priority.REPLY, Priority.ADMIN, Priority.REPLY):
+            tasks.append(asyncio.create_task(waiter(priority)))
+            await asyncio.sleep(0)
+        assert gate.waiting() == {"REPLY": 2, "ADMIN": 1, "CHANNEL": 1, "BULK": 1}
+
+        gate.release(Priority.REPLY)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == [
+        Priority.REPLY, Priority.REPLY, Priority.ADMIN, Priority.CHANNEL, Priority.BULK
+    ]
+
+
+def test_background_classes_leave_a_slot_for_replies():
+    async def scenario():
+        gate = _gate(slots=3, background_slots=1)
+        await gate.acquire(Priority.CHANNEL)
+        bulk = asyncio.create_task(gate.acquire(Priority.BULK))
+        await asyncio.sleep(0.01)
+        # Фоновий слот зайнятий: BULK чекає, хоча загальні слоти вільні
+        assert not bulk.done()
+        await asyncio.wait_for(gate.acquire(Priority.REPLY), 0.1)
+        await asyncio.wait_for(gate.acquire(Priority.ADMIN), 0.1)
+        assert gate.free == 0
+
+        gate.release(Priority.CHANNEL)
+        await asyncio.sleep(0)
+        # Звільнився і загальний, і фоновий слот
+        assert bulk.done()
+        return gate.free, gate.background_free
+
+    assert asyncio.run(scenario()) == (0, 0)
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    async def scenario():
+        gate = _gate(slots=1, background_slots=1)
+        await gate.acquire(Priority.REPLY)
+        waiter = asyncio.create_task(gate.acquire(Priority.ADMIN))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        gate.release(Priority.REPLY)
+        await asyncio.wait_for(gate.acquire(Priority.REPLY), 0.1)
+        return gate.free, gate.waiting()
+
+    free, waiting = asyncio.run(scenario())
+    assert free == 0
+    assert sum(waiting.values()) == 0
+
+
+def test_global_rate_spaces_out_acquisitions():
+    async def scenario():
+        gate = _PriorityGate(4, 4, TokenBucket(20.0, 1))
+        started = time.monotonic()
+        for _ in range(3):
+            await gate.acquire(Priority.REPLY)
+            gate.release(Priority.REPLY)
+        return time.monotonic() - started
+
+    # Перший токен одразу, далі по одному на 50 мс
+    assert 0.09 <= asyncio.run(scenario()) < 0.5
+
+
+def _scheduler(max_retries: int = 2) -> OutboundScheduler:
+    return OutboundScheduler(slots=2, background_slots=1, global_rate=1000.0, chat_rate=1000.0,
+                             chat_burst=10, group_rate=1000.0, max_retries=max_retries)
+
+
+def test_scheduler_pauses_chat_and_retries_after_429():
+    method = SendMessage(chat_id=5, text="x")
+    calls = []
+
+    async def make_request(bot, method):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise TelegramRetryAfter(method, "flood", 0.1)
+        return "ok"
+
+    async def scenario():
+        scheduler = _scheduler()
+        result = await scheduler(make_request, None, method)
+        return scheduler, result
+
+    scheduler, result = asyncio.run(scenario())
+    assert result == "ok"
+    assert calls[1] - calls[0] >= 0.09
+    assert scheduler.retries == 1
+    assert scheduler.sent["REPLY"] == 1
+    assert scheduler.gate.free == scheduler.slots
+
+
+def test_scheduler_passes_through_unscheduled_methods():
+    async def make_request(bot, method):
+        return "me"
+
+    scheduler = _scheduler()
+    assert asyncio.run(scheduler(make_request, None, GetMe())) == "me"
+    assert sum(scheduler.sent.values()) == 0
@@ -0,0 +1,87 @@
+# tests/test_publish_progress.py
+import asyncio
+from types import SimpleNamespace
+from handlers.admin import PublishProgress
+
+
+class FakeBot:
+    def __init__(self):
+        self.calls = []
+
+    async def send_message(self, chat_id, text):
+        self.calls.append(("send", text))
+        await asyncio.sleep(0)
+        return SimpleNamespace(message_id=7)
+
+    async def edit_message_text(self, text, chat_id, message_id):
+        self.calls.append(("edit", text))
+
+    async def delete_message(self, chat_id, message_id):
+        self.calls.append(("delete", message_id))
+
+
+def test_progress_edits_one_status_message():
+    """Прогрес двох відео — одне повідомлення, часті оновлення зливаються"""
+    async def scenario():
+        bot = FakeBot()
+        progress = PublishProgress(bot, chat_id=1)
+        progress(0, 1, 4)
+        progress(2, 1, 2)
+        await asyncio.sleep(0.01)
+        progress(0, 2, 4)
+        progress(0, 4, 4)
+        progress(2, 2, 2)
+        await progress.close()
+        return bot.calls
+
+    calls = asyncio.run(scenario())
+    assert calls[0] == ("send", "🎬 Обробка відео: 2/6 сегментів")
+    assert calls[-2] == ("edit", "🎬 Обробка відео: 6/6 сегментів")
+    assert calls[-1] == ("delete", 7)
+    assert len(calls) == 3
+
+
+def test_progress_without_videos_sends_nothing():
+    async def scenario():
+        bot = FakeBot()
+        await PublishProgress(bot, chat_id=1).close()
+        return bot.calls
+
+    assert asyncio.run(scenario()) == []
+
+
+def test_video_progress_reaches_event_loop(monkeypatch, tmp_path):
+    """Прогрес сегментів з потоку ffmpeg доходить до on_progress в event loop"""
+    from utils import watermark
+
+    def fake_segmented(input_path, output_path, on_progress=None):
+        for done in (1, 2, 3):
+            on_progress(done, 3)
+        with open(output_path, "wb") as f:
+            f.write(b"video")
+
+    class VideoBot:
+        async def get_file(self, file_id):
+            return SimpleNamespace(file_path="videos/1.mp4", file_unique_id="u1")
+
+        async def download_file(self, file_path, destination):
+            destination.write(b"input")
+
+    monkeypatch.setattr(watermark, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(watermark, "process_video_segmented", fake_segmented)
+    seen = []
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+
+        def on_progress(done, total):
+            assert asyncio.get_running_loop() is loop
+            seen.append((done, total))
+
+        media = await watermark.process_media_for_album(VideoBot(), "v1", "video", on_progress=on_progress)
+        # Колбеки з потоку стоять у черзі loop раніше за результат to_thread
+        assert seen == [(1, 3), (2, 3), (3, 3)]
+        return media
+
+    media = asyncio.run(scenario())
+    assert media.media.path == str(tmp_path / "v1_out.mp4")
@@ -0,0 +1,86 @@
+# tests/test_rate_limit.py
+import asyncio
+import pytest
+from utils import rate_limit
+from utils.rate_limit import RateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def _limiter(max_buckets=100):
+    # 2 спроби, далі одна на 10 секунд
+    return RateLimiter({"news": (2, 10.0)}, max_buckets=max_buckets, checkpoint_interval=30.0)
+
+
+def test_burst_then_wait_for_refill(clock):
+    limiter = _limiter()
+    assert limiter.hit(42, "news") == 0
+    assert limiter.hit(42, "news") == 0
+    assert limiter.hit(42, "news") == pytest.approx(10.0)
+
+    clock.now += 4
+    assert limiter.hit(42, "news") == pytest.approx(6.0)
+    clock.now += 6
+    assert limiter.hit(42, "news") == 0
+    # Відмова не забирає токен
+    assert limiter.hit(42, "news") == pytest.approx(10.0)
+
+
+def test_refill_is_capped_at_capacity(clock):
+    limiter = _limiter()
+    limiter.hit(42, "news")
+    clock.now += 3600
+    assert limiter.hit(42, "news") == 0
+    assert limiter.hit(42, "news") == 0
+    assert limiter.hit(42, "news") > 0
+
+
+def test_users_and_actions_are_independent(clock):
+    limiter = _limiter()
+    limiter.hit(42, "news")
+    limiter.hit(42, "news")
+    assert limiter.hit(43, "news") == 0
+    # Дія без ліміту і адмін (ADMIN_IDS=[1]) не обмежуються
+    assert limiter.hit(42, "other") == 0
+    for _ in range(5):
+        assert limiter.hit(1, "news") == 0
+
+
+def test_least_recently_used_bucket_is_evicted(clock):
+    limiter = _limiter(max_buckets=2)
+    limiter.hit(10, "news")
+    limiter.hit(11, "news")
+    limiter.hit(10, "news")
+    limiter.hit(12, "news")
+    assert list(limiter._buckets) == [(10, "news"), (12, "news")]
+    # Витіснений бакет усе одно потрапить у наступне збереження
+    assert (11, "news") in limiter._dirty
+
+
+def test_failed_checkpoint_keeps_changes(clock, monkeypatch):
+    limiter = _limiter()
+
+    async def failing_save(rows):
+        limiter.hit(42, "news")  # новіша зміна, поки запис іде в БД
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(rate_limit.db, "save_rate_buckets", failing_save)
+    limiter.hit(42, "news")
+    limiter.hit(43, "news")
+    asyncio.run(limiter.checkpoint())
+
+    assert set(limiter._dirty) == {(42, "news"), (43, "news")}
+    assert limiter._dirty[(42, "news")][0] == 0  # новіша зміна не перезаписана старою
@@ -0,0 +1,131 @@
+# tests/test_watermark.py
+import asyncio
+import glob
+import io
+import os
+import threading
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from PIL import Image
+from utils import watermark
+
+
+def test_get_pattern_png_concurrent_same_size(monkeypatch, tmp_path):
+    """Два відео однієї роздільності одночасно: обидва отримують цілий PNG"""
+    monkeypatch.setattr(watermark, "TEMP_DIR", str(tmp_path))
+    barrier = threading.Barrier(4)
+    original = watermark.create_pattern_layer
+
+    def slow_layer(w, h):
+        # Всі потоки доходять до запису одночасно
+        barrier.wait()
+        return original(w, h)
+
+    monkeypatch.setattr(watermark, "create_pattern_layer", slow_layer)
+    results, errors = [], []
+
+    def worker():
+        try:
+            results.append(watermark.get_pattern_png(320, 240))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert len(set(results)) == 1
+    with Image.open(results[0]) as image:
+        assert image.size == (320, 240)
+    # Тимчасові файли не лишаються
+    assert glob.glob(os.path.join(tmp_path, ".pattern_*")) == []
+
+
+def _gradient(size):
+    x = np.linspace(0, 255, size[0], dtype=np.uint8)
+    y = np.linspace(0, 255, size[1], dtype=np.uint8)
+    rgb = np.stack(np.broadcast_arrays(x[None, :], y[:, None], (x[None, :] // 2 + y[:, None] // 2)), axis=-1)
+    return Image.fromarray(np.ascontiguousarray(rgb), "RGB")
+
+
+@pytest.mark.parametrize("fmt", ["TIFF", "BMP", "PPM"])
+def test_uncompressed_over_limit_is_decoded_in_bands(monkeypatch, fmt):
+    """Нестиснений кадр понад ліміт читається смугами і дорівнює зменшеному повному"""
+    monkeypatch.setattr(watermark.settings, "WATERMARK_MEMORY_LIMIT_MB", 1)
+    source = _gradient((1200, 900))
+    buffer = io.BytesIO()
+    source.save(buffer, format=fmt)
+
+    with Image.open(io.BytesIO(buffer.getvalue())) as image:
+        assert watermark._raw_layout(image) is not None
+        fitted = watermark._fit_memory_limit(image, watermark.PHOTO_PROFILES["channel"])
+
+    assert watermark._decoded_cost(fitted.size, "RGB") <= 1024 * 1024
+    expected = np.asarray(source.resize(fitted.size, Image.Resampling.BOX), dtype=np.int16)
+    assert np.abs(np.asarray(fitted, dtype=np.int16) - expected).mean() < 2
+
+    result = watermark.render_watermarked_photo(buffer.getvalue())
+    with Image.open(io.BytesIO(result)) as output:
+        assert output.size == fitted.size
+
+
+def test_png_over_limit_is_rejected(monkeypatch):
+    """PNG Pillow декодує лише цілком — понад ліміт MemoryError (публікується оригінал)"""
+    monkeypatch.setattr(watermark.settings, "WATERMARK_MEMORY_LIMIT_MB", 1)
+    buffer = io.BytesIO()
+    _gradient((1200, 900)).save(buffer, format="PNG")
+    with pytest.raises(MemoryError):
+        watermark.render_watermarked_photo(buffer.getvalue())
+
+
+def test_document_keeps_full_size_within_limit(monkeypatch):
+    """Документ у межах ліміту не зменшується, понад ліміт — зменшується до ліміту"""
+    buffer = io.BytesIO()
+    _gradient((1200, 900)).save(buffer, format="JPEG")
+
+    monkeypatch.setattr(watermark.settings, "WATERMARK_MEMORY_LIMIT_MB", 8)
+    result = watermark.render_watermarked_photo(buffer.getvalue(), watermark.DOCUMENT_PROFILE)
+    with Image.open(io.BytesIO(result)) as output:
+        assert output.size == (1200, 900)
+
+    monkeypatch.setattr(watermark.settings, "WATERMARK_MEMORY_LIMIT_MB", 1)
+    result = watermark.render_watermarked_photo(buffer.getvalue(), watermark.DOCUMENT_PROFILE)
+    with Image.open(io.BytesIO(result)) as output:
+        assert output.width < 1200
+        assert watermark._decoded_cost(output.size, "RGB") <= 1024 * 1024
+
+
+def test_process_album_calls_get_file_once_per_item(monkeypatch, tmp_path):
+    """Старий запис без file_unique_id: File з першого get_file іде в обробку"""
+    buffer = io.BytesIO()
+    _gradient((64, 48)).save(buffer, format="JPEG")
+    calls = []
+
+    class PhotoBot:
+        async def get_file(self, file_id):
+            calls.append(file_id)
+            return SimpleNamespace(file_path=f"photos/{file_id}.jpg", file_unique_id=f"u-{file_id}")
+
+        async def download_file(self, file_path, destination):
+            destination.write(buffer.getvalue())
+
+    async def no_cache(file_unique_id, file_type):
+        return None
+
+    monkeypatch.setattr(watermark, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(watermark, "_get_cached_file_id", no_cache)
+    monkeypatch.setattr(watermark.image_pool, "workers", 0)
+    records = [
+        {'file_id': "a", 'file_type': 'photo', 'file_unique_id': None},
+        {'file_id': "b", 'file_type': 'photo', 'file_unique_id': "u-b"},
+    ]
+
+    media = asyncio.run(watermark.process_album(PhotoBot(), records))
+
+    assert sorted(calls) == ["a", "b"]
+    assert records[0]['file_unique_id'] == "u-a"
+    assert all(not isinstance(item.media, str) for item in media)
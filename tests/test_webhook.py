@@ -0,0 +1,132 @@
+# tests/test_webhook.py
+import asyncio
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot, Dispatcher
+from aiogram.types import Message, Update
+from utils.webhook import SECRET_HEADER, WebhookServer, update_chat_key
+
+SECRET = "secret"
+HEADERS = {SECRET_HEADER: SECRET}
+
+
+def _update(update_id: int, chat_id: int = 10) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": str(update_id),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "x"},
+        },
+    }
+
+
+async def _serve(dp: Dispatcher, workers: int, queue_size: int, put_timeout: float = 0.1):
+    bot = Bot("1:test")
+    server = WebhookServer(dp, bot, SECRET, workers=workers, queue_size=queue_size, put_timeout=put_timeout)
+    client = TestClient(TestServer(server.make_app("/webhook")))
+    await client.start_server()
+    server.start_workers()
+    return server, client, bot
+
+
+async def _post(client: TestClient, payload, headers=HEADERS) -> int:
+    response = await client.post("/webhook", json=payload, headers=headers)
+    return response.status
+
+
+def test_rejects_wrong_secret_and_invalid_update():
+    async def scenario():
+        server, client, bot = await _serve(Dispatcher(), workers=1, queue_size=4)
+        try:
+            return (
+                await _post(client, _update(1), headers={SECRET_HEADER: "wrong"}),
+                await _post(client, {"update_id": "nope"}),
+                server.accepted,
+            )
+        finally:
+            await server.stop_workers(timeout=1)
+            await client.close()
+            await bot.session.close()
+
+    assert asyncio.run(scenario()) == (401, 400, 0)
+
+
+def test_chat_order_survives_backpressure():
+    """Переповнена черга відхиляє все до спорожніння: повторна доставка не ламає порядок"""
+    handled = []
+
+    async def scenario():
+        release = asyncio.Event()
+        dp = Dispatcher()
+
+        @dp.message()
+        async def handler(message: Message):
+            await release.wait()
+            handled.append(int(message.text))
+
+        server, client, bot = await _serve(dp, workers=1, queue_size=4)
+        try:
+            # 1 обробляється, 2..5 у черзі, далі — 503
+            statuses = {i: await _post(client, _update(i)) for i in range(1, 9)}
+            rejected = [i for i, status in statuses.items() if status == 503]
+            assert statuses[1] == 200 and rejected == [6, 7, 8]
+
+            release.set()
+            while server.queues[0].qsize() > server.low_water:
+                await asyncio.sleep(0.01)
+            # Telegram повторює доставку з першого відхиленого
+            assert [await _post(client, _update(i)) for i in rejected] == [200, 200, 200]
+            await server.stop_workers(timeout=2)
+            return server.rejected
+        finally:
+            await client.close()
+            await bot.session.close()
+
+    assert asyncio.run(scenario()) == 3
+    assert handled == list(range(1, 9))
+
+
+def test_busy_chat_does_not_block_other_chats():
+    handled = []
+
+    async def scenario():
+        release = asyncio.Event()
+        dp = Dispatcher()
+
+        @dp.message()
+        async def handler(message: Message):
+            if message.chat.id == 10:
+                await release.wait()
+            handled.append(message.chat.id)
+
+        server, client, bot = await _serve(dp, workers=2, queue_size=4)
+        try:
+            # 10 і 11 потрапляють у різні черги (10 % 2 != 11 % 2)
+            assert await _post(client, _update(1, chat_id=10)) == 200
+            assert await _post(client, _update(2, chat_id=11)) == 200
+            for _ in range(50):
+                if handled:
+                    break
+                await asyncio.sleep(0.01)
+            blocked = list(handled)
+            release.set()
+            await server.stop_workers(timeout=2)
+            return blocked
+        finally:
+            await client.close()
+            await bot.session.close()
+
+    assert asyncio.run(scenario()) == [11]
+    assert handled == [11, 10]
+
+
+def test_update_chat_key_uses_callback_message_chat():
+    update = Update.model_validate({
+        "update_id": 5,
+        "callback_query": {
+            "id": "q", "chat_instance": "c", "data": "x",
+            "from": {"id": 7, "is_bot": False, "first_name": "x"},
+            "message": _update(3, chat_id=-100)["message"],
+        },
+    })
+    assert update_chat_key(update) == -100
@@ -0,0 +1,196 @@
+# utils/fanout.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Iterable, NamedTuple, TypeVar
+from aiohttp import ClientConnectorError
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup, Message
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """
+    Token bucket, що видає не відмову, а час очікування: кожен виклик резервує
+    токен (баланс може піти в мінус), і черговість зберігається без блокувань.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+        self.blocked_until = 0.0
+
+    def reserve(self, cost: float = 1.0) -> float:
+        """Забирає cost токенів і повертає, скільки секунд зачекати перед запитом"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        self.tokens -= cost
+        delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(delay, self.blocked_until - now)
+
+    def available_in(self, cost: float = 1.0) -> float:
+        """Через скільки секунд буде cost токенів — без резервування"""
+        now = time.monotonic()
+        tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        delay = (cost - tokens) / self.rate if tokens < cost else 0.0
+        return max(delay, self.blocked_until - now)
+
+    def block(self, seconds: float) -> None:
+        """Telegram попросив паузу (retry_after) — нові запити чекають до її кінця"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class Delivery(NamedTuple):
+    """Результат розсилки одному отримувачу"""
+    chat_id: int
+    ok: bool
+    result: Any = None
+    error: str | None = None
+
+
+class FanOut:
+    """
+    Паралельна розсилка з дотриманням лімітів Telegram:
+    загальний бакет на бота (~30 повідомлень/с) і окремий на кожен чат (~1/с).
+    Відповідь 429 (TelegramRetryAfter) не губить повідомлення: запит
+    перепланується після retry_after, інші отримувачі тим часом не чекають.
+    Коли темп і 429 обробляє OutboundScheduler (pace=False), FanOut їх не повторює.
+    Після мережевої помилки запит повторюється, лише якщо він точно не дійшов
+    до Telegram (не вдалося з'єднатись) — інакше альбом міг би вийти двічі.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: int, max_retries: int):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._chat_buckets: OrderedDict[int, TokenBucket] = OrderedDict()
+        # Вимикається, коли темп задає OutboundScheduler (utils/outbound.py) для всього бота
+        self.pace = True
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            if len(self._chat_buckets) > 10000:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def call(self, chat_id: int, request: Callable[[], Awaitable[T]]) -> T:
+        """Виконує один запит до API для chat_id з лімітами і повторами"""
+        for attempt in range(self.max_retries + 1):
+            if self.pace:
+                delay = max(self.global_bucket.reserve(), self._chat_bucket(chat_id).reserve())
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            try:
+                return await request()
+            except TelegramRetryAfter as e:
+                # Без власного темпу 429 вже повторив OutboundScheduler — другий шар не потрібен
+                if not self.pace or attempt == self.max_retries:
+                    raise
+                logger.warning(f"⏳ Flood control для {chat_id}: повтор через {e.retry_after} с")
+                self._chat_bucket(chat_id).block(e.retry_after)
+            except TelegramNetworkError as e:
+                if not _never_sent(e) or attempt == self.max_retries:
+                    raise
+                logger.warning(f"⚠️ Немає з'єднання з Telegram для {chat_id} ({e}), повтор")
+                await asyncio.sleep(min(2 ** attempt, 30))
+
+    async def fan_out(self, chat_ids: Iterable[int],
+                      send: Callable[[int], Awaitable[Any]]) -> list[Delivery]:
+        """
+        Викликає send(chat_id) для всіх отримувачів одночасно.
+        send робить свої запити через self.call. Повертає результат по кожному чату.
+        """
+        async def deliver(chat_id: int) -> Delivery:
+            try:
+                return Delivery(chat_id, True, await send(chat_id))
+            except Exception as e:
+                logger.error(f"⚠️ Не вдалося надіслати в {chat_id}: {e}")
+                return Delivery(chat_id, False, error=str(e))
+
+        return list(await asyncio.gather(*(deliver(chat_id) for chat_id in chat_ids)))
+
+
+def _never_sent(error: TelegramNetworkError) -> bool:
+    """
+    Чи запит точно не дійшов до Telegram. aiogram загортає помилку aiohttp
+    у TelegramNetworkError, тож оригінал лежить у __context__. Таймаут чи обрив
+    після відправки не означає, що Telegram нічого не отримав.
+    """
+    return isinstance(error.__context__, ClientConnectorError)
+
+
+def sent_file_id(message: Message) -> str | None:
+    """file_id файлу з надісланого повідомлення (для фото — найбільший розмір)"""
+    if message.photo:
+        return message.photo[-1].file_id
+    for media in (message.video, message.document, message.animation, message.audio):
+        if media:
+            return media.file_id
+    return None
+
+
+def with_file_ids(media_group: list, messages: list[Message]) -> list:
+    """
+    Та сама медіагрупа, але замість завантажуваних файлів — file_id,
+    які Telegram видав при першій відправці. Підписи і parse_mode зберігаються.
+    """
+    result = []
+    for input_media, message in zip(media_group, messages):
+        file_id = None if isinstance(input_media.media, str) else sent_file_id(message)
+        result.append(input_media.model_copy(update={"media": file_id}) if file_id else input_media)
+    return result
+
+
+async def send_media_group_to_all(bot: Bot, chat_ids: Iterable[int], media_group: list,
+                                  keyboard: InlineKeyboardMarkup | None = None,
+                                  keyboard_text: str = "⬆️ Оберіть дію:") -> list[Delivery]:
+    """
+    Надсилає одну медіагрупу (і, за потреби, повідомлення з кнопками) кільком чатам.
+    Якщо в групі є файли для завантаження, вони вантажаться один раз — першому
+    отримувачу, — а решта отримує ті самі файли за file_id, паралельно.
+    """
+    chat_ids = list(chat_ids)
+
+    def send_to(group: list):
+        async def send(chat_id: int) -> list[Message]:
+            messages = await fanout.call(chat_id, lambda: bot.send_media_group(chat_id, media=group))
+            if keyboard:
+                await fanout.call(chat_id, lambda: bot.send_message(chat_id, keyboard_text, reply_markup=keyboard))
+            return messages
+        return send
+
+    deliveries: dict[int, Delivery] = {}
+    pending = chat_ids
+    # Поки хоч один файл не має file_id — шлемо по одному, доки хтось не отримає
+    while pending and not all(isinstance(m.media, str) for m in media_group):
+        chat_id, pending = pending[0], pending[1:]
+        delivery = (await fanout.fan_out([chat_id], send_to(media_group)))[0]
+        deliveries[chat_id] = delivery
+        if delivery.ok:
+            media_group = with_file_ids(media_group, delivery.result)
+
+    for delivery in await fanout.fan_out(pending, send_to(media_group)):
+        deliveries[delivery.chat_id] = delivery
+    return [deliveries[chat_id] for chat_id in chat_ids]
+
+
+fanout = FanOut(
+    global_rate=settings.FANOUT_GLOBAL_RATE,
+    chat_rate=settings.FANOUT_CHAT_RATE,
+    chat_burst=settings.FANOUT_CHAT_BURST,
+    max_retries=settings.FANOUT_MAX_RETRIES,
+)
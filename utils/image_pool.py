@@ -0,0 +1,135 @@
+# utils/image_pool.py
+import asyncio
+import logging
+import multiprocessing
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _job_entry(conn, func, args) -> None:
+    """Виконується в окремому процесі: рахує func(*args) і віддає результат через pipe"""
+    try:
+        result = ("ok", func(*args))
+    except BaseException as e:
+        result = ("error", e)
+    try:
+        conn.send(result)
+    except Exception as e:
+        # Виняток, який не пакується pickle, передаємо текстом
+        conn.send(("error", RuntimeError(f"{type(e).__name__}: {e}")))
+    finally:
+        conn.close()
+
+
+class ImageWorkerPool:
+    """
+    Процеси для важкої обробки фото (декодування, накладання, JPEG).
+    Робота йде в окремих процесах, тому event loop aiogram не блокується.
+
+    - кожна задача — окремий процес, форкнутий від forkserver з уже імпортованими
+      модулями (старт за мілісекунди), тож зависле декодування зупиняється
+      terminate() без шкоди іншим задачам;
+    - одночасно рахується не більше workers задач, в роботі та в черзі — не більше
+      workers + queue_size;
+    - кожна задача має таймаут, після якого викликаючий отримує TimeoutError,
+      а її процес зупиняється.
+    """
+
+    def __init__(self, workers: int, queue_size: int, timeout: float, preload: tuple[str, ...] = ()):
+        self.workers = workers
+        self.timeout = timeout
+        self.preload = list(preload)
+        self._slots = asyncio.Semaphore(max(workers, 1) + queue_size)
+        self._running = asyncio.Semaphore(max(workers, 1))
+        self._processes: set = set()
+        self._context = None
+
+    def _get_context(self):
+        if self._context is None:
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                # forkserver, а не fork: дочірні процеси не успадковують event loop і пул БД
+                self._context = multiprocessing.get_context("forkserver")
+                self._context.set_forkserver_preload(self.preload)
+            else:
+                self._context = multiprocessing.get_context("spawn")
+            logger.info(f"🧵 Обробка фото в процесах ({self._context.get_start_method()}, до {self.workers} одночасно)")
+        return self._context
+
+    def start(self) -> None:
+        """Запускає forkserver заздалегідь, щоб перша публікація не чекала на імпорти"""
+        if self.workers <= 0:
+            return
+        process = self._get_context().Process(target=int, daemon=True)
+        process.start()
+        process.join()
+
+    async def run(self, func, *args):
+        """Виконує func(*args) у процесі. Аргументи і результат мають бути picklable."""
+        await self._slots.acquire()
+
+        if self.workers <= 0:
+            # Процеси вимкнено в конфігурації — рахуємо в потоці. Потік не зупинити,
+            # тому після таймауту слот лишається зайнятим, доки він справді не завершиться.
+            future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+            future.add_done_callback(self._release_slot)
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+
+        try:
+            async with self._running:
+                return await self._run_in_process(func, args)
+        finally:
+            self._slots.release()
+
+    async def _run_in_process(self, func, args):
+        context = self._get_context()
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_job_entry, args=(sender, func, args), daemon=True)
+        # З forkserver старт — це лише запит до сервера, event loop не блокується помітно
+        process.start()
+        sender.close()
+        self._processes.add(process)
+        received = asyncio.ensure_future(asyncio.to_thread(receiver.recv))
+        try:
+            try:
+                status, value = await asyncio.wait_for(asyncio.shield(received), self.timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"❌ Обробка фото перевищила {self.timeout} с, зупиняю її процес")
+                raise
+            except EOFError:
+                await asyncio.to_thread(process.join)
+                raise RuntimeError(f"Процес обробки фото завершився аварійно (код {process.exitcode})")
+            if status == "error":
+                raise value
+            return value
+        finally:
+            self._processes.discard(process)
+            if not received.done():
+                # Таймаут або скасування: процес більше нікому не потрібен
+                process.terminate()
+            # Після terminate() pipe закривається, і recv() у потоці завершується з EOFError;
+            # закриваємо receiver лише після цього
+            await asyncio.wait([received])
+            if not received.cancelled():
+                received.exception()
+            receiver.close()
+            await asyncio.to_thread(process.join)
+
+    def _release_slot(self, future: asyncio.Future) -> None:
+        self._slots.release()
+        if not future.cancelled():
+            future.exception()  # щоб asyncio не скаржився на непрочитану помилку
+
+    def shutdown(self) -> None:
+        for process in list(self._processes):
+            process.terminate()
+        self._processes.clear()
+
+
+image_pool = ImageWorkerPool(
+    workers=settings.IMAGE_WORKERS,
+    queue_size=settings.IMAGE_QUEUE_SIZE,
+    timeout=settings.IMAGE_JOB_TIMEOUT,
+    # Модулі, які forkserver імпортує один раз, а процеси задач отримують уже готовими
+    preload=("utils.watermark",),
+)
@@ -0,0 +1,24 @@
+# utils/media_files.py
+from typing import List
+from aiogram.types import Message
+
+
+def media_file(message: Message) -> dict | None:
+    """
+    Файл повідомлення у вигляді, в якому він зберігається в заявці.
+    file_unique_id потрібен кешу оброблених файлів (utils/watermark.py).
+    """
+    if message.photo:
+        file, file_type = message.photo[-1], 'photo'
+    elif message.video:
+        file, file_type = message.video, 'video'
+    elif message.document:
+        file, file_type = message.document, 'document'
+    else:
+        return None
+    return {'file_id': file.file_id, 'file_unique_id': file.file_unique_id, 'type': file_type}
+
+
+def collect_media_files(messages: List[Message]) -> list:
+    """Файли повідомлень (альбому) у порядку повідомлень"""
+    return [item for item in map(media_file, messages) if item]
@@ -0,0 +1,99 @@
+# utils/media_io.py
+import io
+import os
+import mmap
+import tempfile
+from contextlib import contextmanager
+from PIL import Image
+
+
+class MediaSpool:
+    """
+    Буфер для завантаження медіа з Telegram.
+    Поки файл менший за max_size — лежить у пам'яті, більший — переїжджає у файл на диску.
+
+    На відміну від tempfile.SpooledTemporaryFile, файл на диску має ім'я:
+    воркер пулу відкриває його через mmap, а ffmpeg читає напряму,
+    тож вміст не копіюється між процесами.
+    """
+
+    def __init__(self, max_size: int, dir: str | None = None, suffix: str = ""):
+        self.max_size = max_size
+        self.dir = dir
+        self.suffix = suffix
+        self.path: str | None = None
+        self._buffer: io.BytesIO | None = io.BytesIO()
+        self._file = None
+
+    @property
+    def on_disk(self) -> bool:
+        return self._file is not None
+
+    def _rollover(self) -> None:
+        fd, self.path = tempfile.mkstemp(dir=self.dir, suffix=self.suffix)
+        self._file = os.fdopen(fd, "w+b")
+        self._file.write(self._buffer.getbuffer())
+        self._buffer = None
+
+    # --- інтерфейс файлу, який потрібен bot.download_file ---
+
+    def write(self, data: bytes) -> int:
+        if self._file is None and self._buffer.tell() + len(data) > self.max_size:
+            self._rollover()
+        return (self._file or self._buffer).write(data)
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return (self._file or self._buffer).seek(offset, whence)
+
+    def tell(self) -> int:
+        return (self._file or self._buffer).tell()
+
+    # ---
+
+    def source(self) -> str | bytes:
+        """Що передати воркеру: шлях, якщо файл на диску, інакше байти"""
+        if self._file is not None:
+            self._file.flush()
+            return self.path
+        return self._buffer.getvalue()
+
+    def to_path(self) -> str:
+        """Гарантує, що вміст лежить на диску (для ffmpeg), і повертає шлях"""
+        if self._file is None:
+            self._rollover()
+        self._file.flush()
+        return self.path
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self._buffer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@contextmanager
+def open_image(source: str | bytes):
+    """
+    Відкриває фото з байтів або з файлу на диску (через mmap, без читання в пам'ять).
+    Зображення валідне тільки всередині блоку with — завантажуйте (load) його там.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with Image.open(mm) as image:
+                yield image
+    else:
+        # BytesIO над bytes не копіює дані, поки в нього не пишуть
+        with Image.open(io.BytesIO(source)) as image:
+            yield image
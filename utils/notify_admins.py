@@ -5,6 +5,7 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.enums import ParseMode
 from aiogram.utils.media_group import MediaGroupBuilder
 from config import settings
+from utils.fanout import fanout, Delivery, send_media_group_to_all
 
 logger = logging.getLogger(__name__)
 
@@ -20,8 +21,11 @@ async def notify_admins(
     video=None,
     media_files: list = None,
     is_anonymous: bool = False,
-) -> None:
-    """Надсилає повідомлення адмінам з вибором варіанту публікації"""
+) -> list[Delivery]:
+    """
+    Надсилає повідомлення адмінам з вибором варіанту публікації.
+    Всім адмінам одночасно, з лімітами Telegram; повертає результат по кожному адміну.
+    """
     from aiogram.types import InputMediaPhoto, InputMediaVideo, InputMediaDocument
 
     username = username or "Без юзернейму"
@@ -57,48 +61,41 @@ async def notify_admins(
             ]
         ])
 
-    successful_sends = 0
-    
     # 2. Сповіщення йдуть в приватні повідомлення (в бот)
-    for admin_id in settings.ADMIN_IDS:
-        try:
-            # Логіка відправки альбому
-            if media_files and len(media_files) > 0:
-                media_group = []
-                for i, m in enumerate(media_files):
-                    if m['type'] == 'photo':
-                        media = InputMediaPhoto(media=m['file_id'])
-                    elif m['type'] == 'video':
-                        media = InputMediaVideo(media=m['file_id'])
-                    elif m['type'] == 'document':
-                        media = InputMediaDocument(media=m['file_id'])
-                    else:
-                        continue
+    # Логіка відправки альбому: група збирається один раз на всіх адмінів
+    if media_files and len(media_files) > 0:
+        media_group = []
+        for m in media_files:
+            if m['type'] == 'photo':
+                media = InputMediaPhoto(media=m['file_id'])
+            elif m['type'] == 'video':
+                media = InputMediaVideo(media=m['file_id'])
+            elif m['type'] == 'document':
+                media = InputMediaDocument(media=m['file_id'])
+            else:
+                continue
 
-                    if i == 0:
-                        media.caption = user_info
-                        media.parse_mode = ParseMode.HTML
+            if not media_group:
+                media.caption = user_info
+                media.parse_mode = ParseMode.HTML
 
-                    media_group.append(media)
+            media_group.append(media)
 
-                await bot.send_media_group(admin_id, media=media_group)
-                if admin_kb:
-                    await bot.send_message(admin_id, "⬆️ Оберіть дію:", reply_markup=admin_kb)
-            
+        deliveries = await send_media_group_to_all(bot, settings.ADMIN_IDS, media_group, keyboard=admin_kb)
+    else:
+        async def send(admin_id: int):
             # Логіка для поодиноких файлів (legacy)
-            elif photo:
-                await bot.send_photo(admin_id, photo[-1].file_id, caption=user_info,
-                                   parse_mode=ParseMode.HTML, reply_markup=admin_kb)
-            elif video:
-                await bot.send_video(admin_id, video.file_id, caption=user_info,
-                                   parse_mode=ParseMode.HTML, reply_markup=admin_kb)
-            else:
-                await bot.send_message(admin_id, user_info, reply_markup=admin_kb,
-                                     parse_mode=ParseMode.HTML)
-            
-            successful_sends += 1
-        except Exception as e:
-            logger.error(f"⚠️ Не вдалося надіслати адміну {admin_id}: {e}")
+            if photo:
+                return await fanout.call(admin_id, lambda: bot.send_photo(
+                    admin_id, photo[-1].file_id, caption=user_info, parse_mode=ParseMode.HTML, reply_markup=admin_kb))
+            if video:
+                return await fanout.call(admin_id, lambda: bot.send_video(
+                    admin_id, video.file_id, caption=user_info, parse_mode=ParseMode.HTML, reply_markup=admin_kb))
+            return await fanout.call(admin_id, lambda: bot.send_message(
+                admin_id, user_info, reply_markup=admin_kb, parse_mode=ParseMode.HTML))
+
+        deliveries = await fanout.fan_out(settings.ADMIN_IDS, send)
 
-    if successful_sends == 0:
+    if not any(d.ok for d in deliveries):
         logger.warning("❌ Жоден адмін не отримав повідомлення!")
+    return deliveries
@@ -0,0 +1,229 @@
+# utils/outbound.py
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod, Response
+from config import settings
+from utils.fanout import TokenBucket, fanout
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Класи вихідних повідомлень, від найтерміновішого"""
+    REPLY = 0    # відповіді користувачам
+    ADMIN = 1    # сповіщення і відповіді адмінам
+    CHANNEL = 2  # публікації в канал
+    BULK = 3     # експорт, розсилки, дайджести
+
+
+# Явний клас для запитів усередині блоку with send_priority(...)
+_priority_override: ContextVar[Priority | None] = ContextVar("outbound_priority", default=None)
+
+# Методи, що надсилають або змінюють повідомлення в чаті, — саме на них діють ліміти Telegram.
+# Решта (getUpdates, getFile, answerCallbackQuery...) проходять без черги.
+_SCHEDULED_PREFIXES = ("send", "copyMessage", "forwardMessage", "editMessage")
+
+
+@contextmanager
+def send_priority(priority: Priority):
+    """Всі відправки всередині блоку йдуть із заданим пріоритетом"""
+    token = _priority_override.set(priority)
+    try:
+        yield
+    finally:
+        _priority_override.reset(token)
+
+
+class _PriorityGate:
+    """
+    Обмежує кількість одночасних запитів і загальний темп бота; вільне місце
+    (і токен загального бакета) отримує найтерміновіший з тих, хто чекає.
+    Фонові класи (канал, bulk) займають не більше background_slots місць,
+    тож для відповідей користувачам завжди лишається вільний слот.
+    """
+
+    def __init__(self, slots: int, background_slots: int, bucket: TokenBucket):
+        self.free = slots
+        self.background_free = min(background_slots, slots)
+        self.bucket = bucket
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+
+    @staticmethod
+    def _is_background(priority: int) -> bool:
+        return priority >= Priority.CHANNEL
+
+    def _can_take(self, priority: int) -> bool:
+        return self.free > 0 and (not self._is_background(priority) or self.background_free > 0)
+
+    def _take(self, priority: int) -> None:
+        self.bucket.reserve()
+        self.free -= 1
+        if self._is_background(priority):
+            self.background_free -= 1
+
+    def waiting(self) -> dict[str, int]:
+        depth = {p.name: 0 for p in Priority}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                depth[Priority(priority).name] += 1
+        return depth
+
+    async def acquire(self, priority: int) -> None:
+        if not self._waiters and self._can_take(priority) and self.bucket.available_in() <= 0:
+            self._take(priority)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Слот уже видали, але задачу скасували — повертаємо
+                self.release(priority)
+            raise
+
+    def release(self, priority: int) -> None:
+        self.free += 1
+        if self._is_background(priority):
+            self.background_free += 1
+        self._wake()
+
+    def _wake(self) -> None:
+        # Прибираємо скасованих і віддаємо слоти за пріоритетом
+        self._waiters = [w for w in self._waiters if not w[2].done()]
+        heapq.heapify(self._waiters)
+        skipped = []
+        while self._waiters and self.free > 0:
+            delay = self.bucket.available_in()
+            if delay > 0:
+                # Загальний темп вичерпано — наступного розбудимо, коли з'явиться токен
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+                break
+            priority, seq, future = heapq.heappop(self._waiters)
+            if self._can_take(priority):
+                self._take(priority)
+                future.set_result(None)
+            else:
+                skipped.append((priority, seq, future))
+        for waiter in skipped:
+            heapq.heappush(self._waiters, waiter)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._wake()
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Центральна черга всіх відправок бота, підключається як middleware сесії Bot:
+    хендлери й далі викликають bot.send_*, а черговість і темп задає планувальник.
+
+    - пріоритет: відповіді користувачам > адміни > канал > bulk;
+    - загальний темп бота і темп кожного чату (приватний ~1/с, група/канал ~20/хв);
+    - TelegramRetryAfter: чат ставиться на паузу, запит повторюється після неї;
+    - метрики: глибина черги по класах, скільки надіслано, повтори, найдовше очікування.
+    """
+
+    def __init__(self, slots: int, background_slots: int, global_rate: float, chat_rate: float,
+                 chat_burst: int, group_rate: float, max_retries: int):
+        self.slots = slots
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.gate = _PriorityGate(slots, background_slots, self.global_bucket)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._chat_buckets: dict[int | str, TokenBucket] = {}
+        self.sent = {p.name: 0 for p in Priority}
+        self.retries = 0
+        self.max_wait = {p.name: 0.0 for p in Priority}
+
+    def install(self, bot: Bot) -> None:
+        """Підключає планувальник до сесії бота; власний темп і повтори 429 у FanOut більше не потрібні"""
+        bot.session.middleware(self)
+        fanout.pace = False
+
+    def classify(self, chat_id) -> Priority:
+        override = _priority_override.get()
+        if override is not None:
+            return override
+        if chat_id == settings.CHANNEL_ID:
+            return Priority.CHANNEL
+        if chat_id in settings.ADMIN_IDS:
+            return Priority.ADMIN
+        return Priority.REPLY
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Від'ємні id і @username — групи та канали, у них ліміт нижчий
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, self.chat_burst)
+            if len(self._chat_buckets) > 10000:
+                self._chat_buckets.pop(next(iter(self._chat_buckets)))
+        return bucket
+
+    def stats(self) -> dict:
+        return {
+            "waiting": self.gate.waiting(),
+            "in_flight": self.slots - self.gate.free,
+            "sent": dict(self.sent),
+            "retries": self.retries,
+            "max_wait": dict(self.max_wait),
+        }
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Response:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not method.__api_method__.startswith(_SCHEDULED_PREFIXES):
+            return await make_request(bot, method)
+
+        priority = self.classify(chat_id)
+        queued_at = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            # Темп чату і пауза після 429 — до черги за слотом: слот тримаємо лише на час запиту,
+            # інакше чати на паузі забирали б місця у відповідей іншим користувачам
+            delay = self._chat_bucket(chat_id).reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # Слот і токен загального темпу видаються за пріоритетом
+            await self.gate.acquire(priority)
+            try:
+                if attempt == 0:
+                    waited = time.monotonic() - queued_at
+                    self.max_wait[priority.name] = max(self.max_wait[priority.name], waited)
+                response = await make_request(bot, method)
+                self.sent[priority.name] += 1
+                return response
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                logger.warning(f"⏳ Flood control ({priority.name}, чат {chat_id}): пауза {e.retry_after} с")
+                self._chat_bucket(chat_id).block(e.retry_after)
+            finally:
+                self.gate.release(priority)
+
+
+outbound = OutboundScheduler(
+    slots=settings.OUTBOUND_SLOTS,
+    background_slots=settings.OUTBOUND_BACKGROUND_SLOTS,
+    global_rate=settings.FANOUT_GLOBAL_RATE,
+    chat_rate=settings.FANOUT_CHAT_RATE,
+    chat_burst=settings.FANOUT_CHAT_BURST,
+    group_rate=settings.OUTBOUND_GROUP_RATE,
+    max_retries=settings.FANOUT_MAX_RETRIES,
+)
@@ -0,0 +1,121 @@
+# utils/rate_limit.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from config import settings
+from database.db import db
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Антиспам на token bucket: окремий бакет на кожну пару (користувач, дія).
+    Кожна спроба забирає один токен, токени відновлюються з часом до місткості бакета.
+
+    Перевірка працює тільки з пам'яттю — жодного запиту до БД у хендлері.
+    Змінені бакети у фоні зберігаються в rate_limit_buckets і підтягуються
+    при старті, тож рестарт бота не обнуляє ліміти.
+    """
+
+    def __init__(self, limits: dict, max_buckets: int, checkpoint_interval: float):
+        self.limits = limits
+        self.max_buckets = max_buckets
+        self.checkpoint_interval = checkpoint_interval
+        # (user_id, action) -> [tokens, момент оновлення за time.monotonic()]
+        self._buckets: OrderedDict[tuple[int, str], list[float]] = OrderedDict()
+        # Змінені з останнього збереження, включно з уже витісненими з пам'яті
+        self._dirty: dict[tuple[int, str], tuple[float, float]] = {}
+        self._task: asyncio.Task | None = None
+
+    def _refill(self, key: tuple[int, str], now: float) -> list[float]:
+        capacity, period = self.limits[key[1]]
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(capacity), now]
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(float(capacity), bucket[0] + (now - bucket[1]) / period)
+            bucket[1] = now
+        return bucket
+
+    def hit(self, user_id: int, action: str) -> float:
+        """
+        Забирає токен для дії. Повертає 0, якщо дію дозволено,
+        інакше — скільки секунд чекати до наступної спроби.
+        """
+        if action not in self.limits or user_id in settings.ADMIN_IDS:
+            return 0.0
+
+        now = time.monotonic()
+        key = (user_id, action)
+        bucket = self._refill(key, now)
+        if bucket[0] < 1:
+            _, period = self.limits[action]
+            return (1 - bucket[0]) * period
+
+        bucket[0] -= 1
+        self._dirty[key] = (bucket[0], now)
+        return 0.0
+
+    # --- збереження в БД ---
+
+    async def load(self) -> None:
+        """Відновлює бакети, які ще не встигли наповнитись (тобто досі щось обмежують)"""
+        max_age = max((capacity * period for capacity, period in self.limits.values()), default=0)
+        rows = await db.load_rate_buckets(max_age)
+        now_wall, now = time.time(), time.monotonic()
+        for row in rows:
+            if row["action"] not in self.limits:
+                continue
+            age = max(now_wall - row["updated_at"].timestamp(), 0.0)
+            self._buckets[(row["user_id"], row["action"])] = [row["tokens"], now - age]
+        logger.info(f"🚦 Rate limiter: відновлено {len(rows)} бакетів")
+
+    async def checkpoint(self) -> None:
+        """Зберігає змінені бакети одним пакетом"""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        now_wall, now = time.time(), time.monotonic()
+        rows = [
+            (user_id, action, tokens, datetime.fromtimestamp(now_wall - (now - stamp), timezone.utc))
+            for (user_id, action), (tokens, stamp) in dirty.items()
+        ]
+        try:
+            await db.save_rate_buckets(rows)
+        except Exception as e:
+            # Не втрачаємо зміни: повертаємо їх, якщо новіших ще не з'явилось
+            for key, value in dirty.items():
+                self._dirty.setdefault(key, value)
+            logger.error(f"❌ Не вдалося зберегти стан rate limiter: {e}")
+
+    async def _checkpoint_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            await self.checkpoint()
+
+    async def start(self) -> None:
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error(f"❌ Не вдалося відновити стан rate limiter: {e}")
+        self._task = asyncio.create_task(self._checkpoint_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.checkpoint()
+
+
+rate_limiter = RateLimiter(
+    limits=settings.RATE_LIMITS,
+    max_buckets=settings.RATE_LIMIT_MAX_BUCKETS,
+    checkpoint_interval=settings.RATE_LIMIT_CHECKPOINT_INTERVAL,
+)
@@ -1,7 +1,18 @@
+import functools
+import glob
 import io
 import os
+import re
+import shutil
 import asyncio
 import logging
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import NamedTuple
+import numpy as np
 from PIL import Image, ImageEnhance
 
 # Налаштування логування (щоб бачити помилки в терміналі)
@@ -13,10 +24,16 @@ if not hasattr(Image, 'ANTIALIAS'):
     Image.ANTIALIAS = Image.Resampling.LANCZOS
 
 from aiogram import Bot
-from aiogram.types import BufferedInputFile, InputMediaPhoto, InputMediaVideo, FSInputFile
+from aiogram.types import BufferedInputFile, File, InputMediaPhoto, InputMediaVideo, InputMediaDocument, FSInputFile
 from config import settings
+from database.db import db
+from utils.image_pool import image_pool
+from utils.media_io import MediaSpool, open_image
+from utils.fanout import sent_file_id
 
-video_processing_semaphore = asyncio.Semaphore(1)
+# Окремі ліміти паралельності для фото і відео (відео значно важчі)
+photo_processing_semaphore = asyncio.Semaphore(settings.ALBUM_PHOTO_CONCURRENCY)
+video_processing_semaphore = asyncio.Semaphore(settings.ALBUM_VIDEO_CONCURRENCY)
 
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 # ‼️ ВАЖЛИВО: Переконайтеся, що файл PNG, а не SVG
@@ -26,52 +43,184 @@ TEMP_DIR = os.path.join(BASE_DIR, "temp")
 if not os.path.exists(TEMP_DIR):
     os.makedirs(TEMP_DIR)
 
-def create_pattern_layer(base_width: int, base_height: int) -> Image.Image:
-    """Створює шар-паттерн (сітку) з логотипів"""
+# --- КЕШ ЛОГОТИПУ ТА ПАТЕРНІВ ---
+# Підготовка логотипу (resize + rotate + прозорість) і розкладка сітки дорогі,
+# а фото з одного телефону зазвичай мають кілька однакових роздільностей.
+# Тому кешуємо готовий логотип за цільовою шириною і цілий шар за (w, h).
+# Обидва кеші скидаються, якщо змінився mtime файлу логотипу.
+
+_cache_lock = threading.RLock()
+_logo_cache: "OrderedDict[int, Image.Image]" = OrderedDict()
+_pattern_cache: "OrderedDict[tuple[int, int], WatermarkPattern]" = OrderedDict()
+_pattern_cache_bytes = 0
+_logo_source: Image.Image | None = None
+_logo_mtime: float | None = None
+
+
+def _check_logo_version() -> bool:
+    """Перевіряє mtime логотипу і скидає кеші, якщо файл змінився.
+    Повертає False, якщо логотипу немає."""
+    global _logo_source, _logo_mtime
     try:
-        if not os.path.exists(LOGO_PNG_PATH):
-            logger.warning(f"Logo not found: {LOGO_PNG_PATH}")
-            return Image.new("RGBA", (base_width, base_height), (0, 0, 0, 0))
+        mtime = os.path.getmtime(LOGO_PNG_PATH)
+    except OSError:
+        if _logo_mtime is not None:
+            clear_watermark_cache()
+        return False
 
-        logo = Image.open(LOGO_PNG_PATH).convert("RGBA")
-        
-        # --- НАЛАШТУВАННЯ ---
-        # Розмір: 40% від ширини фото
-        target_w = int(base_width * 0.40)
-        if target_w < 50: target_w = 50
-        
-        ratio = logo.height / logo.width
+    if mtime != _logo_mtime:
+        clear_watermark_cache()
+        with Image.open(LOGO_PNG_PATH) as src:
+            _logo_source = src.convert("RGBA")
+        _logo_mtime = mtime
+    return True
+
+
+def clear_watermark_cache() -> None:
+    """Повністю очищує кеш логотипів і патернів"""
+    global _logo_source, _logo_mtime, _pattern_cache_bytes
+    with _cache_lock:
+        _logo_cache.clear()
+        _pattern_cache.clear()
+        _pattern_cache_bytes = 0
+        _logo_source = None
+        _logo_mtime = None
+
+
+def get_prepared_logo(target_w: int) -> Image.Image | None:
+    """Повертає повернутий і напівпрозорий логотип заданої ширини (LRU-кеш).
+    Результат спільний для всіх викликів — не змінюйте його на місці."""
+    with _cache_lock:
+        if not _check_logo_version():
+            return None
+
+        logo = _logo_cache.get(target_w)
+        if logo is not None:
+            _logo_cache.move_to_end(target_w)
+            return logo
+
+        ratio = _logo_source.height / _logo_source.width
         target_h = int(target_w * ratio)
-        
-        logo = logo.resize((target_w, target_h), Image.Resampling.LANCZOS)
-        
+
+        logo = _logo_source.resize((target_w, target_h), Image.Resampling.LANCZOS)
+
         # Поворот -30 градусів
         logo = logo.rotate(30, expand=True, resample=Image.Resampling.BICUBIC)
-        
+
         # Прозорість: 0.7 (70%)
         r, g, b, alpha = logo.split()
         alpha = ImageEnhance.Brightness(alpha).enhance(0.7)
         logo.putalpha(alpha)
-        # ---------------------
 
-        # Створюємо пустий прозорий шар
-        layer = Image.new("RGBA", (base_width, base_height), (0, 0, 0, 0))
-        logo_w, logo_h = logo.size
+        _logo_cache[target_w] = logo
+        while len(_logo_cache) > settings.WATERMARK_LOGO_CACHE_SIZE:
+            _logo_cache.popitem(last=False)
+        return logo
 
-        # Відступ між логотипами (лого + 5% простору)
-        step_x = int(logo_w * 1.05)
-        step_y = int(logo_h * 1.05)
 
-        # Заповнюємо шар (Паттерн)
-        # Починаємо з мінуса, щоб перекрити краї
-        start_x = -int(logo_w * 0.2)
-        start_y = -int(logo_h * 0.2)
+class WatermarkPattern:
+    """Розріджене представлення шару-патерну.
+    Логотипи покривають лише кілька відсотків кадру, тому зберігаємо тільки
+    непрозорі пікселі: їхні індекси, колір і alpha."""
 
-        for y in range(start_y, base_height, step_y):
-            for x in range(start_x, base_width, step_x):
-                layer.paste(logo, (x, y), logo)
-        
-        return layer
+    __slots__ = ("width", "height", "index", "color", "alpha")
+
+    def __init__(self, layer: Image.Image):
+        rgba = np.asarray(layer).reshape(-1, 4)
+        index = np.flatnonzero(rgba[:, 3])
+        if layer.width * layer.height < 2 ** 32:
+            index = index.astype(np.uint32)
+
+        self.width, self.height = layer.size
+        self.index = index
+        self.color = rgba[index, :3]
+        self.alpha = rgba[index, 3:4].astype(np.uint16)
+
+    @property
+    def nbytes(self) -> int:
+        return self.index.nbytes + self.color.nbytes + self.alpha.nbytes
+
+    def to_image(self) -> Image.Image:
+        """Відновлює повний RGBA-шар (потрібен для відео)"""
+        rgba = np.zeros((self.width * self.height, 4), dtype=np.uint8)
+        rgba[self.index, :3] = self.color
+        rgba[self.index, 3:4] = self.alpha
+        return Image.fromarray(rgba.reshape(self.height, self.width, 4), "RGBA")
+
+
+def _store_pattern(key: tuple[int, int], pattern: WatermarkPattern) -> None:
+    """Кладе патерн у кеш і витісняє найстаріші, поки не вліземо в бюджет пам'яті"""
+    global _pattern_cache_bytes
+    budget = settings.WATERMARK_PATTERN_CACHE_MB * 1024 * 1024
+    if pattern.nbytes > budget:
+        return
+
+    _pattern_cache[key] = pattern
+    _pattern_cache_bytes += pattern.nbytes
+    while _pattern_cache_bytes > budget:
+        _, old = _pattern_cache.popitem(last=False)
+        _pattern_cache_bytes -= old.nbytes
+
+
+def render_pattern_rows(base_width: int, base_height: int, top: int, rows: int) -> Image.Image:
+    """Малює рядки [top, top + rows) патерну для кадру base_width x base_height.
+    Смуга збігається з відповідною частиною повного шару, але пам'ять — лише на смугу."""
+    # --- НАЛАШТУВАННЯ ---
+    # Розмір: 40% від ширини фото
+    target_w = int(base_width * 0.40)
+    if target_w < 50: target_w = 50
+
+    logo = get_prepared_logo(target_w)
+
+    # Створюємо пустий прозорий шар
+    layer = Image.new("RGBA", (base_width, rows), (0, 0, 0, 0))
+    logo_w, logo_h = logo.size
+
+    # Відступ між логотипами (лого + 5% простору)
+    step_x = int(logo_w * 1.05)
+    step_y = int(logo_h * 1.05)
+
+    # Заповнюємо шар (Паттерн)
+    # Починаємо з мінуса, щоб перекрити краї
+    start_x = -int(logo_w * 0.2)
+    start_y = -int(logo_h * 0.2)
+
+    for y in range(start_y, min(base_height, top + rows), step_y):
+        if y + logo_h <= top:
+            continue
+        for x in range(start_x, base_width, step_x):
+            layer.paste(logo, (x, y - top), logo)
+
+    return layer
+
+
+def get_pattern(base_width: int, base_height: int) -> WatermarkPattern | None:
+    """Повертає (кешований) патерн для кадру заданого розміру.
+    None — якщо логотипу немає."""
+    key = (base_width, base_height)
+    with _cache_lock:
+        if not _check_logo_version():
+            return None
+
+        pattern = _pattern_cache.get(key)
+        if pattern is not None:
+            _pattern_cache.move_to_end(key)
+            return pattern
+
+        layer = render_pattern_rows(base_width, base_height, 0, base_height)
+        pattern = WatermarkPattern(layer)
+        _store_pattern(key, pattern)
+        return pattern
+
+
+def create_pattern_layer(base_width: int, base_height: int) -> Image.Image:
+    """Створює шар-паттерн (сітку) з логотипів"""
+    try:
+        pattern = get_pattern(base_width, base_height)
+        if pattern is None:
+            logger.warning(f"Logo not found: {LOGO_PNG_PATH}")
+            return Image.new("RGBA", (base_width, base_height), (0, 0, 0, 0))
+        return pattern.to_image()
 
     except Exception as e:
         logger.error(f"Error creating pattern: {e}")
@@ -89,80 +238,634 @@ def overlay_logo_on_image(image: Image.Image) -> Image.Image:
         logger.error(f"Error overlaying logo: {e}")
         return image
 
+# --- ШВИДКЕ НАКЛАДАННЯ (NumPy) ---
+# Замість RGBA-копії фото, alpha_composite і ще однієї вставки на білий фон
+# змішуємо патерн прямо в RGB-буфер цілочисельною арифметикою,
+# і тільки в тих пікселях, де логотип не прозорий.
+
+def _div255(x: np.ndarray) -> np.ndarray:
+    """Точне округлення x / 255 для uint16 без float (змінює x на місці)"""
+    x += 128
+    x += x >> 8
+    x >>= 8
+    return x
+
+
+def _has_alpha(image: Image.Image) -> bool:
+    return image.mode in ("RGBA", "LA", "PA") or (
+        image.mode == "P" and "transparency" in image.info
+    )
+
+
+def _to_rgb_array(image: Image.Image) -> np.ndarray:
+    """RGB-копія фото як (h, w, 3) uint8. Прозорі ділянки кладуться на білий фон,
+    як це робив старий шлях через background.paste()."""
+    if not _has_alpha(image):
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return np.array(image)
+
+    # Вставка з маскою в Pillow (C) значно швидша за ту саму формулу в NumPy
+    rgba = image.convert("RGBA")
+    background = Image.new("RGB", rgba.size, (255, 255, 255))
+    background.paste(rgba, mask=rgba.getchannel("A"))
+    return np.array(background)
+
+
+def blend_pattern(rgb: np.ndarray, pattern: WatermarkPattern) -> None:
+    """Змішує патерн з RGB-масивом (h, w, 3) на місці"""
+    flat = rgb.reshape(-1, 3)
+    px = flat[pattern.index].astype(np.uint16)
+    px *= 255 - pattern.alpha
+    px += pattern.color * pattern.alpha
+    flat[pattern.index] = _div255(px)
+
+
+def watermark_image_rgb(image: Image.Image) -> Image.Image:
+    """Накладає патерн і одразу повертає RGB-фото, готове до збереження в JPEG"""
+    rgb = _to_rgb_array(image)
+    try:
+        pattern = get_pattern(image.width, image.height)
+        if pattern is None:
+            logger.warning(f"Logo not found: {LOGO_PNG_PATH}")
+        else:
+            blend_pattern(rgb, pattern)
+    except Exception as e:
+        logger.error(f"Error overlaying logo: {e}")
+    return Image.fromarray(rgb, "RGB")
+
+# --- ВЕЛИКІ ЗОБРАЖЕННЯ (смугами) ---
+# Панорами і скани, надіслані документом, можуть мати сотні мегапікселів.
+# Повний шлях тримає кілька копій кадру одночасно (RGB-масив, патерн, результат),
+# тому для великих кадрів накладаємо патерн смугами прямо в декодоване фото:
+# поверх самого фото в пам'яті живе лише одна смуга.
+
+# Приблизна вартість повного шляху в байтах на піксель:
+# декодоване фото + RGB-масив + результат + шар під час побудови патерну
+_FULL_PATH_BYTES_PER_PX = 13
+_STRIP_BYTES_PER_PX = 20
+
+
+def _memory_limit() -> int:
+    return settings.WATERMARK_MEMORY_LIMIT_MB * 1024 * 1024
+
+
+def _pixel_bytes(mode: str) -> int:
+    """Скільки байт на піксель займає декодований кадр у Pillow (RGB зберігається як RGBX)"""
+    if mode in ("1", "L", "P"):
+        return 1
+    if mode.startswith("I;16"):
+        return 2
+    return 4
+
+
+def _decoded_cost(size: tuple[int, int], mode: str) -> int:
+    """Пам'ять смугового шляху: декодований кадр + RGB-результат, якщо кадр не RGB"""
+    return size[0] * size[1] * (_pixel_bytes(mode) + (0 if mode == "RGB" else 4))
+
+
+def _scaled_to_fit(size: tuple[int, int], budget: int) -> tuple[int, int]:
+    """Найбільший розмір з тими ж пропорціями, RGB-кадр якого влазить у budget"""
+    scale = min(1.0, (budget / _decoded_cost(size, "RGB")) ** 0.5)
+    return max(1, int(size[0] * scale)), max(1, int(size[1] * scale))
+
+
+# Біт на піксель для raw-даних, які можна читати смугами
+_RAW_BITS = {
+    "1": 1, "L": 8, "RGB": 24, "BGR": 24, "RGBX": 32, "RGBA": 32, "BGRA": 32, "BGRX": 32,
+    "CMYK": 32, "LA": 16, "I;16": 16, "I;16B": 16,
+}
+
+
+def _raw_layout(image: Image.Image) -> tuple[int, str, int, int] | None:
+    """
+    (offset, rawmode, stride, ystep) для кадрів, записаних у файлі без стиснення
+    одним блоком (нестиснений TIFF, BMP, PPM). Такий кадр можна читати смугами.
+    PNG, стиснений TIFF і палітрові кадри — None: Pillow декодує їх лише цілком.
+    """
+    if len(image.tile) != 1 or image.mode == "P":
+        return None
+    codec, extents, offset, args = image.tile[0]
+    if codec != "raw" or tuple(extents) != (0, 0, image.width, image.height):
+        return None
+    rawmode, stride, ystep = (args, 0, 1) if isinstance(args, str) else (tuple(args) + (0, 1))[:3]
+    bits = _RAW_BITS.get(rawmode)
+    if bits is None or ystep not in (1, -1):
+        return None
+    return offset, rawmode, stride or (image.width * bits + 7) // 8, ystep
+
+
+def _decode_scaled_in_bands(image: Image.Image, layout: tuple, target: tuple[int, int],
+                            band_budget: int) -> Image.Image:
+    """
+    Читає нестиснений кадр смугами прямо з файлу і зменшує кожну смугу в полотно target.
+    У пам'яті одночасно лише одна смуга оригіналу і зменшене полотно.
+    """
+    offset, rawmode, stride, ystep = layout
+    width, height = image.size
+    canvas = Image.new("RGB", target, (255, 255, 255))
+    band_rows = max(1, band_budget // (width * (_pixel_bytes(image.mode) + 4)))
+    fp = image.fp
+    for top in range(0, height, band_rows):
+        bottom = min(height, top + band_rows)
+        # ystep -1: рядки лежать у файлі знизу догори
+        start = top if ystep == 1 else height - bottom
+        fp.seek(offset + start * stride)
+        data = fp.read((bottom - top) * stride)
+        band = Image.frombytes(image.mode, (width, bottom - top), data, "raw", rawmode, stride, ystep)
+        out_top, out_bottom = round(top * target[1] / height), round(bottom * target[1] / height)
+        if out_bottom > out_top:
+            band = Image.fromarray(_to_rgb_array(band), "RGB")
+            canvas.paste(band.resize((target[0], out_bottom - out_top), Image.Resampling.BOX), (0, out_top))
+    return canvas
+
+
+def _fit_memory_limit(image: Image.Image, profile: "PhotoProfile") -> Image.Image:
+    """
+    Перевіряє за заголовком (до декодування), що фото влізе в ліміт пам'яті,
+    і якщо ні — декодує одразу зменшеним:
+
+    - JPEG — через draft() (декодер сам масштабує в 2/4/8 разів);
+    - нестиснені формати (TIFF без стиснення, BMP, PPM) — смугами з файлу;
+    - PNG і стиснений TIFF Pillow вміє декодувати лише цілком: такі кадри понад ліміт
+      дають MemoryError, і публікується оригінал без водяного знаку.
+
+    Фото для каналу все одно зменшуються до профілю, тож нічого не втрачають.
+    Документ лишається в повному розмірі, якщо влазить у ліміт; інакше він зменшується
+    до найбільшого розміру, що влазить (WATERMARK_MEMORY_LIMIT_MB), і це видно в логах.
+    """
+    # 1/8 ліміту лишаємо на смуги патерну і кодування JPEG
+    budget = _memory_limit() * 7 // 8
+    if _decoded_cost(image.size, image.mode) <= budget:
+        return image
+
+    target = _scaled_to_fit(image.size, budget)
+    if profile.max_dimension and max(image.size) > profile.max_dimension:
+        scale = profile.max_dimension / max(image.size)
+        wanted = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        if wanted[0] < target[0]:
+            target = wanted
+    else:
+        logger.warning(
+            f"Image {image.size} exceeds WATERMARK_MEMORY_LIMIT_MB, watermarking a reduced copy {target}"
+        )
+
+    if image.format == "JPEG":
+        # draft() дає не менше запитаного і менш ніж удвічі більше по кожній стороні
+        doubled = (target[0] * 2, target[1] * 2)
+        image.draft("RGB", target if _decoded_cost(doubled, "RGB") <= budget else (target[0] // 2, target[1] // 2))
+        return image
+
+    layout = _raw_layout(image)
+    if layout is None:
+        raise MemoryError(f"{image.format} image {image.size} exceeds WATERMARK_MEMORY_LIMIT_MB "
+                          f"and cannot be decoded in parts")
+    return _decode_scaled_in_bands(image, layout, target, _memory_limit() - budget)
+
+
+def watermark_image_tiled(image: Image.Image) -> Image.Image:
+    """Те саме, що watermark_image_rgb, але смугами з обмеженою пам'яттю"""
+    width, height = image.size
+    strip_rows = max(16, _memory_limit() // 8 // (width * _STRIP_BYTES_PER_PX))
+
+    image.load()
+    # RGB-фото змінюємо на місці, інші режими збираємо в новий RGB-кадр
+    output = image if image.mode == "RGB" else Image.new("RGB", image.size)
+
+    with _cache_lock:
+        has_logo = _check_logo_version()
+    if not has_logo:
+        logger.warning(f"Logo not found: {LOGO_PNG_PATH}")
+
+    for top in range(0, height, strip_rows):
+        box = (0, top, width, min(height, top + strip_rows))
+        rgb = _to_rgb_array(image.crop(box))
+        if has_logo:
+            strip = render_pattern_rows(width, height, top, box[3] - top)
+            blend_pattern(rgb, WatermarkPattern(strip))
+        output.paste(Image.fromarray(rgb, "RGB"), box[:2])
+
+    return output
+
+
+# --- ПРОФІЛІ ВИХІДНИХ ФОТО ---
+# Telegram все одно стискає фото в каналі до 2560px по більшій стороні,
+# тож немає сенсу декодувати, накладати і завантажувати 48MP оригінал.
+
+class PhotoProfile(NamedTuple):
+    name: str
+    max_dimension: int  # 0 — без обмеження
+    quality: int
+    max_kb: int  # 0 — без цілі за розміром; інакше знижуємо якість, поки не влізе
+    progressive: bool = True
+    optimize: bool = True
+
+    @property
+    def key(self) -> str:
+        """Ідентифікатор профілю для кешу оброблених файлів"""
+        return f"jpeg-{self.name}-{self.max_dimension}-q{self.quality}-{self.max_kb}kb"
+
+
+PHOTO_PROFILES = {
+    # Для каналу: розмір, який Telegram і так показує
+    # (progressive тут не потрібен — Telegram перекодує фото, а коштує він дорого)
+    "channel": PhotoProfile("channel", max_dimension=2560, quality=87, max_kb=0, progressive=False),
+    # Максимальна якість (як було раніше: повний розмір, quality=95)
+    "original": PhotoProfile("original", max_dimension=0, quality=95, max_kb=0,
+                             progressive=False, optimize=False),
+    # Компактний варіант для повільних каналів зв'язку
+    "compact": PhotoProfile("compact", max_dimension=1600, quality=82, max_kb=500),
+}
+
+# Документи надсилають саме заради повної якості — не зменшуємо їх.
+# Виняток — кадр, який у повному розмірі не влазить у WATERMARK_MEMORY_LIMIT_MB:
+# тоді документ зменшується до межі ліміту (див. _fit_memory_limit).
+DOCUMENT_PROFILE = "original"
+
+_MIN_JPEG_QUALITY = 60
+
+
+def get_photo_profile() -> PhotoProfile:
+    return PHOTO_PROFILES.get(settings.PHOTO_PROFILE, PHOTO_PROFILES["channel"])
+
+
+def _decode_for_profile(image: Image.Image, profile: PhotoProfile) -> Image.Image:
+    """Декодує фото не більше, ніж потрібно профілю.
+    Для JPEG draft() змушує декодер одразу масштабувати в 2/4/8 разів,
+    тому великі фото ніколи не розпаковуються в повному розмірі."""
+    max_dim = profile.max_dimension
+    if not max_dim or max(image.size) <= max_dim:
+        return image
+
+    scale = max_dim / max(image.size)
+    target = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    if image.format == "JPEG":
+        image.draft("RGB", target)
+    # Після draft() залишається зменшити менш ніж удвічі — BICUBIC тут достатньо
+    image.thumbnail(target, Image.Resampling.BICUBIC)
+    return image
+
+
+def _encode_jpeg(image: Image.Image, profile: PhotoProfile) -> bytes:
+    quality = profile.quality
+    while True:
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=quality,
+                   progressive=profile.progressive, optimize=profile.optimize)
+        if not profile.max_kb or output.tell() <= profile.max_kb * 1024 or quality <= _MIN_JPEG_QUALITY:
+            return output.getvalue()
+        quality = max(_MIN_JPEG_QUALITY, quality - 8)
+
+
+def render_watermarked_photo(source: str | bytes, profile_name: str | None = None) -> bytes:
+    """Фото (байти або шлях до файлу на диску) -> JPEG з водяним знаком (байти).
+    Викликається у воркері пулу, тому приймає і повертає тільки picklable значення."""
+    profile = PHOTO_PROFILES[profile_name] if profile_name else get_photo_profile()
+    with open_image(source) as image:
+        image = _fit_memory_limit(image, profile)
+        image = _decode_for_profile(image, profile)
+        if image.width * image.height * _FULL_PATH_BYTES_PER_PX > _memory_limit():
+            processed_img = watermark_image_tiled(image)
+        else:
+            processed_img = watermark_image_rgb(image)
+
+    return _encode_jpeg(processed_img, profile)
+
+# --- ВІДЕО (ffmpeg) ---
+# Один процес ffmpeg накладає PNG-патерн фільтром overlay.
+# Кадри не проходять через пам'ять Python, аудіо копіюється без перекодування.
+
+def get_ffmpeg_path() -> str | None:
+    """Шлях до ffmpeg: з конфігу, з PATH або з пакету imageio-ffmpeg"""
+    if settings.FFMPEG_PATH:
+        return settings.FFMPEG_PATH
+    path = shutil.which("ffmpeg")
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return None
+
+
+_VIDEO_SIZE_RE = re.compile(r"Stream #\S+.*?Video:.*?(\d{2,5})x(\d{2,5})")
+_ROTATION_RE = re.compile(r"(?:rotate\s*:\s*|rotation of )(-?\d+)")
+_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+
+
+class VideoInfo(NamedTuple):
+    width: int
+    height: int
+    has_audio: bool
+    duration: float
+
+
+def probe_video(ffmpeg: str, input_path: str) -> VideoInfo:
+    """Розмір кадру (з урахуванням повороту), наявність аудіо і тривалість"""
+    result = subprocess.run(
+        [ffmpeg, "-hide_banner", "-i", input_path],
+        capture_output=True, text=True, errors="replace"
+    )
+    info = result.stderr
+    size = _VIDEO_SIZE_RE.search(info)
+    if not size:
+        raise RuntimeError(f"Не вдалося визначити розмір відео: {input_path}")
+
+    w, h = int(size.group(1)), int(size.group(2))
+    # ffmpeg сам повертає кадри телефонних відео, тож патерн потрібен під повернутий розмір
+    rotation = _ROTATION_RE.search(info)
+    if rotation and abs(int(rotation.group(1))) % 180 == 90:
+        w, h = h, w
+
+    has_audio = re.search(r"Stream #\S+.*?Audio:", info) is not None
+
+    duration = 0.0
+    d = _DURATION_RE.search(info)
+    if d:
+        hours, minutes, seconds = d.groups()
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    return VideoInfo(w, h, has_audio, duration)
+
+
+def _prune_pattern_pngs(version: int) -> None:
+    """
+    Видаляє PNG-патерни старих версій логотипу і найдавніше використані понад
+    WATERMARK_PATTERN_PNG_FILES, щоб temp/ не ріс з кожною новою роздільністю відео.
+    """
+    suffix = f"_{version}.png"
+    current = []
+    for path in glob.glob(os.path.join(TEMP_DIR, "pattern_*.png")):
+        if path.endswith(suffix):
+            current.append(path)
+        else:
+            _remove_quietly(path)
+    current.sort(key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+    for path in current[:max(len(current) - settings.WATERMARK_PATTERN_PNG_FILES, 0)]:
+        _remove_quietly(path)
+
+
+def _remove_quietly(path: str) -> None:
+    # Файл міг уже прибрати інший процес
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def get_pattern_png(base_width: int, base_height: int) -> str:
+    """Зберігає патерн у PNG (один файл на розмір і версію логотипу) і повертає шлях"""
+    with _cache_lock:
+        _check_logo_version()
+        version = int(_logo_mtime or 0)
+    path = os.path.join(TEMP_DIR, f"pattern_{base_width}x{base_height}_{version}.png")
+    try:
+        # mtime — час останнього використання: за ним витісняються найстаріші
+        os.utime(path)
+    except FileNotFoundError:
+        # Унікальний тимчасовий файл: два відео однієї роздільності в альбомі
+        # пишуть патерн паралельно, і кожне має замінити path своїм цілим файлом
+        fd, tmp_path = tempfile.mkstemp(dir=TEMP_DIR, prefix=".pattern_", suffix=".png.tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                create_pattern_layer(base_width, base_height).save(f, format="PNG")
+            os.replace(tmp_path, path)
+        except BaseException:
+            _remove_quietly(tmp_path)
+            raise
+        _prune_pattern_pngs(version)
+    return path
+
+
+def _video_encoder_args() -> list[str]:
+    args = [
+        "-c:v", settings.VIDEO_CODEC,
+        "-preset", settings.VIDEO_PRESET,
+        "-crf", str(settings.VIDEO_CRF),
+        "-pix_fmt", "yuv420p",
+    ]
+    if settings.VIDEO_THREADS:
+        args += ["-threads", str(settings.VIDEO_THREADS)]
+    return args
+
+
+def _run_ffmpeg(args: list[str]) -> None:
+    result = subprocess.run(
+        args, capture_output=True, text=True, errors="replace",
+        timeout=settings.VIDEO_TIMEOUT
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with {result.returncode}: {result.stderr[-500:]}")
+
+
+def _overlay_args(ffmpeg: str, input_path: str, pattern_file: str) -> list[str]:
+    """Спільна частина команди: вхід + патерн -> відео з водяним знаком"""
+    return [
+        ffmpeg, "-y", "-hide_banner", "-loglevel", "error",
+        "-i", input_path, "-i", pattern_file,
+        "-filter_complex", "[0:v][1:v]overlay=0:0:format=auto[v]",
+        "-map", "[v]",
+        *_video_encoder_args(),
+    ]
+
+
+def _run_with_audio(args: list[str], output_path: str, has_audio: bool) -> None:
+    """Запускає ffmpeg, копіюючи аудіо; якщо кодек не лізе в mp4 — перекодовує в AAC"""
+    try:
+        _run_ffmpeg(args + ["-c:a", "copy", "-movflags", "+faststart", output_path])
+    except RuntimeError as e:
+        if not has_audio:
+            raise
+        logger.warning(f"Audio copy failed, re-encoding to AAC: {e}")
+        _run_ffmpeg(args + ["-c:a", "aac", "-b:a", "128k", "-movflags", "+faststart", output_path])
+
+
 def process_video_sync(input_path: str, output_path: str):
-    """Обробка відео через MoviePy"""
+    """Обробка відео через ffmpeg (overlay з PNG-патерном)"""
+    ffmpeg = get_ffmpeg_path()
+    if not ffmpeg:
+        logger.error("ffmpeg not installed!")
+        return
+
     try:
-        from moviepy.editor import VideoFileClip, ImageClip, CompositeVideoClip
-    except ImportError:
-        logger.error("MoviePy/ffmpeg not installed!")
+        info = probe_video(ffmpeg, input_path)
+        pattern_file = get_pattern_png(info.width, info.height)
+        args = _overlay_args(ffmpeg, input_path, pattern_file) + ["-map", "0:a?"]
+        _run_with_audio(args, output_path, info.has_audio)
+    except Exception as e:
+        logger.error(f"ffmpeg error: {e}")
+        raise e
+
+
+def process_video_segmented(input_path: str, output_path: str, on_progress=None):
+    """
+    Обробка довгого відео на всіх ядрах:
+    1. ріжемо вхід по ключових кадрах на N сегментів (без перекодування);
+    2. накладаємо патерн на сегменти паралельно (окремий ffmpeg на кожен);
+    3. склеюємо сегменти concat-демультиплексором без перекодування
+       і додаємо оригінальну аудіодоріжку цілою.
+    on_progress(done, total) викликається після кожного готового сегмента.
+    Короткі відео обробляються звичайним process_video_sync.
+    """
+    ffmpeg = get_ffmpeg_path()
+    if not ffmpeg:
+        logger.error("ffmpeg not installed!")
         return
 
-    video = None
-    final = None
-    pattern_file = output_path + "_pattern.png"
-    
+    workers = settings.VIDEO_SEGMENT_WORKERS or os.cpu_count() or 1
+    info = probe_video(ffmpeg, input_path)
+    if workers < 2 or info.duration < settings.VIDEO_SEGMENT_MIN_DURATION:
+        return process_video_sync(input_path, output_path)
+
+    work_dir = tempfile.mkdtemp(prefix="seg_", dir=TEMP_DIR)
     try:
-        video = VideoFileClip(input_path)
-        
-        # Генеруємо картинку патерну
-        w, h = video.size
-        pattern_img = create_pattern_layer(w, h)
-        pattern_img.save(pattern_file, format="PNG")
-        
-        # Накладаємо на відео
-        watermark_clip = (ImageClip(pattern_file)
-                          .set_duration(video.duration)
-                          .set_position(("center", "center")))
-        
-        final = CompositeVideoClip([video, watermark_clip])
-
-        final.write_videofile(
-            output_path, 
-            codec="libx264", 
-            audio_codec="aac", 
-            preset="ultrafast", 
-            threads=4, 
-            logger=None
-        )
+        pattern_file = get_pattern_png(info.width, info.height)
+
+        # 1. Нарізка (тільки відео, аудіо візьмемо з оригіналу цілим)
+        _run_ffmpeg([
+            ffmpeg, "-y", "-hide_banner", "-loglevel", "error",
+            "-i", input_path, "-map", "0:v:0", "-c", "copy",
+            "-f", "segment", "-segment_time", f"{info.duration / workers:.3f}",
+            "-reset_timestamps", "1",
+            os.path.join(work_dir, "in_%04d.mp4"),
+        ])
+        segments = sorted(f for f in os.listdir(work_dir) if f.startswith("in_"))
+        total = len(segments)
+        logger.info(f"🎬 Відео розрізано на {total} сегментів ({workers} потоків)")
+
+        # 2. Паралельне накладання. Самі процеси ffmpeg і є воркерами,
+        # потоки лише чекають на них.
+        def watermark_segment(name: str) -> str:
+            out_path = os.path.join(work_dir, name.replace("in_", "out_"))
+            _run_ffmpeg(_overlay_args(ffmpeg, os.path.join(work_dir, name), pattern_file)
+                        + ["-an", out_path])
+            return out_path
+
+        outputs = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(watermark_segment, name): name for name in segments}
+            for done, future in enumerate(as_completed(futures), start=1):
+                outputs[futures[future]] = future.result()
+                logger.info(f"🎬 Сегмент {done}/{total} готовий")
+                if on_progress:
+                    on_progress(done, total)
+
+        # 3. Склейка без перекодування + оригінальне аудіо
+        list_path = os.path.join(work_dir, "segments.txt")
+        with open(list_path, "w") as f:
+            for name in segments:
+                f.write(f"file '{outputs[name]}'\n")
+
+        args = [
+            ffmpeg, "-y", "-hide_banner", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", list_path, "-i", input_path,
+            "-map", "0:v", "-map", "1:a?", "-c:v", "copy",
+        ]
+        _run_with_audio(args, output_path, info.has_audio)
     except Exception as e:
-        logger.error(f"MoviePy error: {e}")
+        logger.error(f"ffmpeg segment error: {e}")
         raise e
     finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+# --- КЕШ ОБРОБЛЕНИХ ФАЙЛІВ ---
+# Після першої публікації Telegram видає file_id вже обробленого файлу.
+# Зберігаємо його в БД за (file_unique_id оригіналу, версія водяного знаку, профіль),
+# і повторні публікації відправляють цей file_id без завантаження і обробки.
+
+# Збільшуйте при зміні алгоритму накладання, щоб старі результати не використовувались
+WATERMARK_VERSION = 1
+
+
+def watermark_version() -> str:
+    with _cache_lock:
+        _check_logo_version()
+        return f"{WATERMARK_VERSION}-{int(_logo_mtime or 0)}"
+
+
+def output_profile(file_type: str) -> str:
+    if file_type == 'video':
+        return f"{settings.VIDEO_CODEC}-{settings.VIDEO_PRESET}-crf{settings.VIDEO_CRF}"
+    if file_type == 'document':
+        return PHOTO_PROFILES[DOCUMENT_PROFILE].key
+    return get_photo_profile().key
+
+
+async def _get_cached_file_id(file_unique_id: str | None, file_type: str) -> str | None:
+    if not file_unique_id:
+        return None
+    try:
+        return await db.get_processed_media(file_unique_id, watermark_version(), output_profile(file_type))
+    except Exception as e:
+        logger.error(f"Processed media cache lookup failed: {e}")
+        return None
+
+
+async def remember_processed_media(media_records: list, media_group: list, messages: list) -> None:
+    """
+    Після send_media_group зберігає file_id щойно завантажених оброблених файлів.
+    Файли, що пішли як file_id (оригінал або вже з кешу), пропускаються.
+    """
+    for file_info, input_media, sent in zip(media_records, media_group, messages):
+        if isinstance(input_media.media, str) or not file_info.get('file_unique_id'):
+            continue
+
+        new_file_id = sent_file_id(sent)
+        if not new_file_id:
+            continue
+
         try:
-            if os.path.exists(pattern_file): os.remove(pattern_file)
-            if final: final.close()
-            if video: video.close()
-        except: pass
+            await db.save_processed_media(
+                file_info['file_unique_id'], watermark_version(),
+                output_profile(file_info['file_type']), file_info['file_type'], new_file_id
+            )
+        except Exception as e:
+            logger.error(f"Failed to save processed media: {e}")
+
+
+def _input_media(file_type: str, media):
+    if file_type == 'video':
+        return InputMediaVideo(media=media)
+    if file_type == 'document':
+        return InputMediaDocument(media=media)
+    return InputMediaPhoto(media=media)
 
-async def process_media_for_album(bot: Bot, file_id: str, file_type: str, use_watermark: bool = True):
+
+async def process_media_for_album(bot: Bot, file_id: str, file_type: str, use_watermark: bool = True,
+                                  file_unique_id: str | None = None, on_progress=None, file: File | None = None):
     """
     Головна функція обробки.
-    Повертає InputMediaPhoto або InputMediaVideo.
+    Повертає InputMediaPhoto, InputMediaVideo або InputMediaDocument.
+    file — вже отриманий bot.get_file(file_id), щоб не питати Telegram вдруге.
+    on_progress(done, total) викликається в event loop після кожного готового сегмента відео.
     """
     try:
+        # Вже обробляли цей файл — відправляємо готовий file_id
+        if use_watermark and file_type in ('photo', 'video', 'document'):
+            cached_file_id = await _get_cached_file_id(file_unique_id, file_type)
+            if cached_file_id:
+                return _input_media(file_type, cached_file_id)
+
         # --- ФОТО ---
         if file_type == 'photo':
             if use_watermark:
-                file = await bot.get_file(file_id)
-                file_data = await bot.download_file(file.file_path)
-                image = Image.open(io.BytesIO(file_data.read()))
-                
-                # Накладаємо водяний знак
-                processed_img = overlay_logo_on_image(image)
-                
-                output = io.BytesIO()
-                # Конвертуємо в RGB для JPEG
-                if processed_img.mode == "RGBA":
-                    background = Image.new("RGB", processed_img.size, (255, 255, 255))
-                    background.paste(processed_img, mask=processed_img.split()[3])
-                    processed_img = background
-                elif processed_img.mode != "RGB":
-                    processed_img = processed_img.convert("RGB")
-                
-                processed_img.save(output, format="JPEG", quality=95)
-                output.seek(0)
-                
-                return InputMediaPhoto(media=BufferedInputFile(output.getvalue(), filename="img.jpg"))
+                async with photo_processing_semaphore:
+                    file = file or await bot.get_file(file_id)
+                    # Великі файли одразу пишуться на диск, і воркер читає їх через mmap
+                    with MediaSpool(settings.MEDIA_SPOOL_MAX_MB * 1024 * 1024, dir=TEMP_DIR) as spool:
+                        await bot.download_file(file.file_path, destination=spool)
+
+                        # Декодування, водяний знак і JPEG — в окремому процесі,
+                        # щоб не блокувати обробку апдейтів інших користувачів
+                        try:
+                            jpeg_bytes = await image_pool.run(render_watermarked_photo, spool.source())
+                        except asyncio.TimeoutError:
+                            logger.error(f"⏱️ Фото {file_id} оброблялось задовго, відправляю оригінал")
+                            return InputMediaPhoto(media=file_id)
+
+                # BufferedInputFile віддає ці ж байти при завантаженні без додаткових копій
+                return InputMediaPhoto(media=BufferedInputFile(jpeg_bytes, filename="img.jpg"))
             else:
                 return InputMediaPhoto(media=file_id)
 
@@ -170,26 +873,57 @@ async def process_media_for_album(bot: Bot, file_id: str, file_type: str, use_wa
         elif file_type == 'video':
             if use_watermark:
                 async with video_processing_semaphore:
-                    input_path = os.path.join(TEMP_DIR, f"{file_id}_in.mp4")
                     output_path = os.path.join(TEMP_DIR, f"{file_id}_out.mp4")
-                    
-                    file = await bot.get_file(file_id)
-                    await bot.download_file(file.file_path, destination=input_path)
-                    
-                    try:
-                        await asyncio.to_thread(process_video_sync, input_path, output_path)
-                        
-                        if os.path.exists(output_path):
-                            return InputMediaVideo(media=FSInputFile(output_path))
-                    except Exception as e:
-                        logger.error(f"Video failed: {e}")
-                    
+
+                    file = file or await bot.get_file(file_id)
+                    # ffmpeg потрібен файл з довільним доступом, тому відео завжди йде на диск,
+                    # а вхідний файл видаляється одразу після обробки
+                    with MediaSpool(0, dir=TEMP_DIR, suffix=".mp4") as spool:
+                        await bot.download_file(file.file_path, destination=spool)
+
+                        report = None
+                        if on_progress:
+                            # process_video_segmented звітує з потоку — передаємо в event loop
+                            loop = asyncio.get_running_loop()
+
+                            def report(done: int, total: int) -> None:
+                                loop.call_soon_threadsafe(on_progress, done, total)
+
+                        try:
+                            await asyncio.to_thread(process_video_segmented, spool.to_path(), output_path, report)
+
+                            if os.path.exists(output_path):
+                                return InputMediaVideo(media=FSInputFile(output_path))
+                        except Exception as e:
+                            logger.error(f"Video failed: {e}")
+
                     # Якщо файл не створився — повертаємо оригінал
                     return InputMediaVideo(media=file_id)
             else:
                 return InputMediaVideo(media=file_id)
         
-        # Інші типи файлів (документи тощо)
+        # --- ДОКУМЕНТИ ---
+        # Зображення, надіслані файлом (панорами, скани), обробляються у повній якості.
+        # Якщо документ не зображення — Pillow не відкриє його, і піде оригінал.
+        elif file_type == 'document':
+            if use_watermark:
+                async with photo_processing_semaphore:
+                    file = file or await bot.get_file(file_id)
+                    with MediaSpool(settings.MEDIA_SPOOL_MAX_MB * 1024 * 1024, dir=TEMP_DIR) as spool:
+                        await bot.download_file(file.file_path, destination=spool)
+                        try:
+                            jpeg_bytes = await image_pool.run(
+                                render_watermarked_photo, spool.source(), DOCUMENT_PROFILE
+                            )
+                        except asyncio.TimeoutError:
+                            logger.error(f"⏱️ Документ {file_id} оброблявся задовго, відправляю оригінал")
+                            return InputMediaDocument(media=file_id)
+
+                return InputMediaDocument(media=BufferedInputFile(jpeg_bytes, filename="image.jpg"))
+            else:
+                return InputMediaDocument(media=file_id)
+
+        # Інші типи файлів
         return InputMediaPhoto(media=file_id)
 
     except Exception as e:
@@ -197,7 +931,45 @@ async def process_media_for_album(bot: Bot, file_id: str, file_type: str, use_wa
         logger.error(f"❌ CRITICAL ERROR in process_media_for_album: {e}")
         
         # Якщо сталася помилка — повертаємо оригінальний файл, щоб не губити контент
-        if file_type == 'video':
-            return InputMediaVideo(media=file_id)
-        else:
-            return InputMediaPhoto(media=file_id)
+        return _input_media(file_type, file_id)
+
+
+async def process_album(bot: Bot, media_records: list, use_watermark: bool = True,
+                        on_progress=None) -> list:
+    """
+    Обробляє всі файли альбому одночасно (в межах лімітів для фото і відео).
+    Порядок результату збігається з порядком media_records.
+    on_progress(index, done, total) — прогрес відео з індексом index в альбомі.
+    """
+    async def resolve_file(file_info: dict) -> File | None:
+        try:
+            return await bot.get_file(file_info['file_id'])
+        except Exception as e:
+            logger.error(f"get_file failed for {file_info['file_id']}: {e}")
+            return None
+
+    files = [None] * len(media_records)
+    if use_watermark:
+        # Старі записи не мають file_unique_id — дізнаємось його без завантаження файлу.
+        # Отриманий File передаємо далі, щоб обробка не викликала get_file вдруге.
+        pending = [
+            index for index, file_info in enumerate(media_records)
+            if not file_info.get('file_unique_id') and file_info['file_type'] in ('photo', 'video', 'document')
+        ]
+        for index, file in zip(pending, await asyncio.gather(*[resolve_file(media_records[i]) for i in pending])):
+            files[index] = file
+            if file:
+                media_records[index]['file_unique_id'] = file.file_unique_id
+
+    return list(await asyncio.gather(*[
+        process_media_for_album(
+            bot=bot,
+            file_id=file_info['file_id'],
+            file_type=file_info['file_type'],
+            use_watermark=use_watermark,
+            file_unique_id=file_info.get('file_unique_id'),
+            on_progress=functools.partial(on_progress, index) if on_progress else None,
+            file=files[index]
+        )
+        for index, file_info in enumerate(media_records)
+    ]))
@@ -0,0 +1,193 @@
+# utils/webhook.py
+import asyncio
+import hmac
+import json
+import logging
+import time
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def update_chat_key(update: Update) -> int:
+    """Ключ для порядку обробки: чат, інакше користувач, інакше саме оновлення"""
+    event = update.event
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    return update.update_id
+
+
+class WebhookServer:
+    """
+    Приймає оновлення від Telegram по HTTP і роздає їх воркерам диспетчера.
+
+    - запит без правильного secret token відхиляється (401);
+    - оновлення розкладаються по workers чергах за чатом: у межах одного чату
+      порядок обробки такий самий, як порядок надходження, різні чати йдуть паралельно;
+    - черги обмежені: якщо воркери не встигають, сервер відповідає 503,
+      і Telegram повторить доставку пізніше (backpressure замість росту пам'яті);
+      черга, що відмовила, відхиляє все до спорожніння наполовину, тож порядок у чаті не ламається.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, secret: str, workers: int, queue_size: int,
+                 put_timeout: float, record_path: str = ""):
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self.put_timeout = put_timeout
+        self.record_path = record_path
+        per_worker = max(queue_size // max(workers, 1), 1)
+        self.queues = [asyncio.Queue(maxsize=per_worker) for _ in range(max(workers, 1))]
+        # Черга, що відмовила, знову приймає, коли спорожніє до половини
+        self.low_water = per_worker // 2
+        self._put_locks = [asyncio.Lock() for _ in self.queues]
+        self._overloaded = [False] * len(self.queues)
+        self._workers: list[asyncio.Task] = []
+        self.accepted = 0
+        self.rejected = 0
+        self.failed = 0
+
+    # --- HTTP ---
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token, self.secret):
+            logger.warning(f"🚫 Webhook: невірний secret token від {request.remote}")
+            return web.Response(status=401)
+
+        try:
+            data = await request.json()
+            update = Update.model_validate(data, context={"bot": self.bot})
+        except Exception as e:
+            logger.warning(f"⚠️ Webhook: некоректне оновлення ({e})")
+            return web.Response(status=400)
+
+        if self.record_path:
+            with open(self.record_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(data, ensure_ascii=False) + "\n")
+
+        shard = update_chat_key(update) % len(self.queues)
+        queue = self.queues[shard]
+        # Оновлення однієї черги стають у неї строго по одному: наступне не обійде те,
+        # що ще чекає на місце. Очікування замка і місця разом обмежене put_timeout.
+        lock = self._put_locks[shard]
+        deadline = time.monotonic() + self.put_timeout
+        try:
+            await asyncio.wait_for(lock.acquire(), self.put_timeout)
+        except asyncio.TimeoutError:
+            self._overloaded[shard] = True
+            return self._reject(update)
+        try:
+            if self._overloaded[shard]:
+                if queue.qsize() > self.low_water:
+                    return self._reject(update)
+                self._overloaded[shard] = False
+            try:
+                await asyncio.wait_for(queue.put(update), max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                # Після першої відмови черга відхиляє все, доки не розвантажиться:
+                # інакше пізніше оновлення того ж чату обігнало б повторну доставку відхиленого
+                self._overloaded[shard] = True
+                return self._reject(update)
+        finally:
+            lock.release()
+
+        self.accepted += 1
+        return web.Response()
+
+    def _reject(self, update: Update) -> web.Response:
+        self.rejected += 1
+        logger.warning(f"⏳ Webhook: черга переповнена, оновлення {update.update_id} повернуто Telegram")
+        return web.Response(status=503)
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "queued": [q.qsize() for q in self.queues],
+            "overloaded": [i for i, flag in enumerate(self._overloaded) if flag],
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "failed": self.failed,
+        })
+
+    def make_app(self, path: str) -> web.Application:
+        app = web.Application()
+        app.router.add_post(path, self.handle_update)
+        app.router.add_get("/healthz", self.handle_health)
+        return app
+
+    # --- воркери ---
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            update = await queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"❌ Помилка обробки оновлення {update.update_id}: {e}")
+            finally:
+                queue.task_done()
+
+    def start_workers(self) -> None:
+        self._workers = [asyncio.create_task(self._worker(q)) for q in self.queues]
+
+    async def stop_workers(self, timeout: float = 10.0) -> None:
+        """Дає воркерам дообробити вже прийняте, потім зупиняє їх"""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self.queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ Не всі оновлення встигли обробитись до зупинки")
+        for task in self._workers:
+            task.cancel()
+        self._workers = []
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """Запускає HTTP-сервер і (якщо задано WEBHOOK_URL) реєструє webhook у Telegram"""
+    server = WebhookServer(
+        dp, bot,
+        secret=settings.WEBHOOK_SECRET,
+        workers=settings.WEBHOOK_WORKERS,
+        queue_size=settings.WEBHOOK_QUEUE_SIZE,
+        put_timeout=settings.WEBHOOK_PUT_TIMEOUT,
+        record_path=settings.WEBHOOK_RECORD_PATH,
+    )
+    runner = web.AppRunner(server.make_app(settings.WEBHOOK_PATH))
+    await runner.setup()
+    site = web.TCPSite(runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT)
+
+    server.start_workers()
+    await dp.emit_startup(bot=bot)
+    await site.start()
+    logger.info(
+        f"🌐 Webhook слухає {settings.WEBHOOK_HOST}:{settings.WEBHOOK_PORT}{settings.WEBHOOK_PATH} "
+        f"({settings.WEBHOOK_WORKERS} воркерів)"
+    )
+
+    if settings.WEBHOOK_URL:
+        await bot.set_webhook(
+            url=settings.WEBHOOK_URL.rstrip("/") + settings.WEBHOOK_PATH,
+            secret_token=settings.WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=settings.WEBHOOK_WORKERS * 5,
+        )
+        logger.info(f"✅ Webhook зареєстровано: {settings.WEBHOOK_URL}")
+    else:
+        logger.info("ℹ️ WEBHOOK_URL не задано — webhook у Telegram не реєструється (локальний режим)")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await server.stop_workers()
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()